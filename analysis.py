@@ -0,0 +1,360 @@
+"""Analysis engine shared by the Flask and Streamlit front ends.
+
+The pipeline has three stages: parse an upload into a frame of manager
+columns, aggregate it into count tables for an analysis type, and export
+those tables as a report workbook.
+"""
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from export import report_sheets, write_export
+from manager_names import canonicalize, canonicalize_counts
+from metrics import record, timed
+from upload_spool import open_upload
+from workbook_reader import CASE_ID_COL, CREATED_COL, MANAGER_COL, REPORT_COLUMNS, open_chunks, read_columns, require_column
+
+ALL_ANALYSES = "All analyses"
+COUNT_COL = "Number of Cases"
+
+# Analysis type -> exported file name
+OUTPUT_FILES = {
+    "Report Manager": "manager_case_analysis_report.xlsx",
+    "Assigning Manager": "manager_case_analysis_assigning.xlsx",
+    "Allotment Manager": "manager_case_analysis_allotment.xlsx",
+    ALL_ANALYSES: "manager_case_analysis_all.xlsx",
+}
+
+
+def resolve_analysis(analysis_type):
+    """Return (report_col, output_file); anything unrecognised means Allotment Manager."""
+    if analysis_type not in OUTPUT_FILES:
+        analysis_type = "Allotment Manager"
+    return analysis_type, OUTPUT_FILES[analysis_type]
+
+
+# Workload distribution metrics, in display order
+STAT_LABELS = [
+    ("managers", "Managers"),
+    ("total", "Total cases"),
+    ("mean", "Mean cases per manager"),
+    ("median", "Median cases per manager"),
+    ("p25", "25th percentile"),
+    ("p75", "75th percentile"),
+    ("p90", "90th percentile"),
+    ("p99", "99th percentile"),
+    ("max", "Most cases for one manager"),
+    ("gini", "Gini coefficient"),
+    ("top10_share", "Share of cases held by top 10%"),
+]
+
+
+# Parse stage
+
+def parse_upload(data, sheet=None, canonical=True):
+    """Parse the Manager column plus every report column the upload has.
+
+    Reading all report columns up front means any analysis type can be served
+    from the same parsed frame. The case ID and creation date columns come
+    along when present. ``data`` is the upload's bytes or a memory map of a
+    spooled upload; ``sheet`` names the worksheet to read (default: the first).
+    With ``canonical=False`` names are left as written, for callers that keep
+    the frame beyond the current alias file and canonicalize it on use.
+    """
+    with timed("parse"):
+        df = read_columns(open_upload(data), [MANAGER_COL], optional=REPORT_COLUMNS + [CASE_ID_COL, CREATED_COL], sheet=sheet)
+    record("parse", rows=len(df), columns=df.shape[1], bytes=len(data))
+    # Spelling variants of a name are merged here, once, before any counting
+    return canonical_names(df) if canonical else df
+
+
+def canonical_names(df, index=None):
+    """``df`` with the spelling variants in its name columns merged (see manager_names)."""
+    with timed("canonicalize"):
+        return canonicalize(df, [MANAGER_COL] + REPORT_COLUMNS, index)
+
+
+# Aggregate stage
+
+def aggregate(df, analysis_type, crosstab_top=None):
+    """Count tables for ``analysis_type`` from a parsed frame, as a result dict.
+
+    With ``crosstab_top`` set, the result also carries Manager x report column
+    pair tables limited to that many pairs per manager.
+    """
+    report_col, output_file = resolve_analysis(analysis_type)
+    with timed("aggregate"):
+        result = {"frames": count_cases(df, report_col), "report_col": report_col, "output_file": output_file}
+    record("aggregate", rows=len(df), columns=df.shape[1])
+    if crosstab_top:
+        columns = [c for c in REPORT_COLUMNS if c in df.columns] if report_col == ALL_ANALYSES else [report_col]
+        with timed("crosstab"):
+            result["crosstabs"] = [crosstab_pairs(df, column, crosstab_top) for column in columns]
+    return result
+
+
+def aggregate_stream(file, analysis_type):
+    """Like aggregate, but streams the upload in chunks instead of parsing it (low-memory mode)."""
+    report_col, output_file = resolve_analysis(analysis_type)
+    # Reading and counting are interleaved chunk by chunk, so they are timed as one stage
+    with timed("stream"):
+        columns, chunks = open_chunks(file, [MANAGER_COL], optional=REPORT_COLUMNS)
+        frames = canonicalize_counts(count_streaming(columns, chunks, report_col))
+    record("stream", columns=len(columns))
+    return {"frames": frames, "report_col": report_col, "output_file": output_file}
+
+
+# Export stage
+
+def build_report(result, format="xlsx"):
+    """The report for a result as bytes: an xlsx workbook, or a zip of Parquet, Arrow or CSV files."""
+    sheets = report_sheets(result["frames"], result.get("breakdowns", []), result.get("crosstabs", []),
+                           result.get("breakdown_by", "File"))
+    sheets.append(("Summary", summary_frame(result["frames"])))
+    with timed("export"):
+        data = write_export(sheets, format)
+    record("export", rows=sum(len(frame) for _, frame in sheets), bytes=len(data))
+    return data
+
+
+def analyze_upload(data, analysis_type, chunked=False, crosstab_top=None):
+    """Parse and aggregate raw upload bytes (or a memory-mapped upload) in one go."""
+    if chunked:
+        return aggregate_stream(open_upload(data), analysis_type)
+    return aggregate(parse_upload(data), analysis_type, crosstab_top=crosstab_top)
+
+
+def filled_columns(df):
+    """Manager plus each report column the frame has, with blanks filled from Manager."""
+    columns = {MANAGER_COL: df[MANAGER_COL]}
+    for column in REPORT_COLUMNS:
+        if column in df.columns:
+            columns[column] = df[column].fillna(df[MANAGER_COL])
+    return columns
+
+
+def count_cases(df, report_col):
+    """Count tables for one analysis: [Manager counts, report_col counts], or all four."""
+    if report_col == ALL_ANALYSES:
+        # Manager plus every report column, counted in one pass
+        return list(count_all(df).values())
+
+    require_column(df, report_col)
+    # The frame may be shared through the upload cache, so fill into a new series
+    other = df[report_col].fillna(df[MANAGER_COL])
+
+    manager_cases = df[MANAGER_COL].value_counts().reset_index()
+    manager_cases.columns = [MANAGER_COL, COUNT_COL]
+
+    other_cases = other.value_counts().reset_index()
+    other_cases.columns = [report_col, COUNT_COL]
+    return [manager_cases, other_cases]
+
+
+def count_streaming(columns, chunks, report_col):
+    """Count tables like count_cases, but from row chunks with running counters.
+
+    ``columns`` names the fields of each row tuple (Manager first), as returned
+    by workbook_reader.open_chunks. Only the counters and one chunk are ever in
+    memory, so peak memory doesn't grow with the number of rows.
+    """
+    if report_col == ALL_ANALYSES:
+        wanted = [c for c in REPORT_COLUMNS if c in columns]
+    else:
+        if report_col not in columns:
+            raise ValueError(f"Column '{report_col}' was not found in the uploaded file.")
+        wanted = [report_col]
+    manager_index = columns.index(MANAGER_COL)
+    indexes = [columns.index(c) for c in wanted]
+
+    manager_counts = Counter()
+    counters = [Counter() for _ in wanted]
+    for chunk in chunks:
+        fields = list(zip(*chunk))
+        managers = fields[manager_index]
+        manager_counts.update(m for m in managers if m is not None)
+        for counter, index in zip(counters, indexes):
+            # fillna(df["Manager"]), one row at a time
+            filled = (m if v is None else v for v, m in zip(fields[index], managers))
+            counter.update(v for v in filled if v is not None)
+
+    frames = []
+    for column, counter in zip([MANAGER_COL] + wanted, [manager_counts] + counters):
+        rows = counter.most_common()
+        frames.append(pd.DataFrame(rows or None, columns=[column, COUNT_COL]))
+    return frames
+
+
+def count_all(df):
+    """Case counts for Manager and every report column in one pass.
+
+    All columns are factorized together so they share one code space, the
+    Manager fallback is applied on the codes, and a single bincount over
+    (column, code) pairs produces every table. Returns {column: DataFrame}.
+    """
+    columns = [MANAGER_COL] + [c for c in REPORT_COLUMNS if c in df.columns]
+    n = len(df)
+    stacked = np.concatenate([df[c].to_numpy(dtype=object) for c in columns]) if n else np.array([], dtype=object)
+    codes, names = pd.factorize(stacked)
+    codes = codes.reshape(len(columns), n)
+
+    # fillna(df["Manager"]) for every report column, done on integer codes
+    manager_codes = codes[0]
+    missing = codes[1:] < 0
+    codes[1:][missing] = np.broadcast_to(manager_codes, codes[1:].shape)[missing]
+
+    width = len(names)
+    flat = (codes + np.arange(len(columns))[:, None] * width)[codes >= 0]
+    counts = np.bincount(flat, minlength=len(columns) * width).reshape(len(columns), width)
+
+    tables = {}
+    for column, row in zip(columns, counts):
+        present = np.flatnonzero(row)
+        order = present[np.argsort(-row[present], kind="stable")]
+        tables[column] = pd.DataFrame({column: names[order], COUNT_COL: row[order]})
+    return tables
+
+
+def crosstab_pairs(df, report_col, top_n=None):
+    """Manager x ``report_col`` case counts as a sparse list of non-zero pairs.
+
+    Both columns are factorized and each row becomes one linear index into the
+    (manager, report manager) matrix; np.unique over those indexes yields the
+    non-zero cells directly, so a dense N x M frame is never built. Managers
+    come busiest first, each with their pairs largest first, keeping at most
+    ``top_n`` pairs per manager.
+    """
+    require_column(df, report_col)
+    managers = df[MANAGER_COL]
+    others = df[report_col].fillna(managers)
+    present = (managers.notna() & others.notna()).to_numpy()
+    manager_codes, manager_names = pd.factorize(managers[present])
+    other_codes, other_names = pd.factorize(others[present])
+
+    width = max(len(other_names), 1)
+    cells, counts = np.unique(manager_codes.astype(np.int64) * width + other_codes, return_counts=True)
+    rows, cols = np.divmod(cells, width)
+
+    manager_totals = np.bincount(manager_codes, minlength=len(manager_names))
+    order = np.lexsort((-counts, rows, -manager_totals[rows]))
+    rows, cols, counts = rows[order], cols[order], counts[order]
+
+    if top_n:
+        # Position of each pair within its manager's run of rows
+        index = np.arange(len(rows))
+        starts = np.r_[True, rows[1:] != rows[:-1]] if len(rows) else np.array([], dtype=bool)
+        rank = index - np.maximum.accumulate(np.where(starts, index, 0))
+        keep = rank < top_n
+        rows, cols, counts = rows[keep], cols[keep], counts[keep]
+
+    return pd.DataFrame({
+        MANAGER_COL: np.asarray(manager_names, dtype=object)[rows],
+        report_col: np.asarray(other_names, dtype=object)[cols],
+        COUNT_COL: counts,
+    })
+
+
+def _unique_labels(labels, reserved=("Total",)):
+    seen = set(reserved)
+    unique = []
+    for label in labels:
+        candidate, n = label, 1
+        while candidate in seen:
+            n += 1
+            candidate = f"{label} ({n})"
+        seen.add(candidate)
+        unique.append(candidate)
+    return unique
+
+
+def merge_counts(named_frames):
+    """Merge count tables from several files (or sheets).
+
+    ``named_frames`` is a list of (file name, frames) as returned by count_cases
+    for each file. Returns (merged, breakdowns): the summed count tables, and
+    per table a wide frame with one count column per file plus a Total.
+    """
+    labels = _unique_labels([name for name, _ in named_frames])
+    # Resolve names across all files together so every file shows a manager the same way
+    flat = canonicalize_counts([frame for _, frames in named_frames for frame in frames])
+    by_column = {}
+    start = 0
+    for label, (_, frames) in zip(labels, named_frames):
+        for frame in flat[start:start + len(frames)]:
+            column = frame.columns[0]
+            by_column.setdefault(column, []).append(frame.set_index(column)[COUNT_COL].rename(label))
+        start += len(frames)
+
+    merged, breakdowns = [], []
+    for column, series in by_column.items():
+        wide = pd.concat(series, axis=1).reindex(columns=[s.name for s in series]).fillna(0).astype("int64")
+        total = wide.sum(axis=1).sort_values(ascending=False, kind="stable")
+        merged.append(total.rename_axis(column).reset_index(name=COUNT_COL))
+        wide = wide.loc[total.index]
+        wide["Total"] = total
+        breakdowns.append(wide.rename_axis(column).reset_index())
+    return merged, breakdowns
+
+
+def limit_counts(frame, top_k=None, min_cases=None):
+    """Keep rows with at least ``min_cases`` cases, then the ``top_k`` largest."""
+    if min_cases is not None:
+        frame = frame[frame[COUNT_COL] >= min_cases]
+    if top_k is not None:
+        frame = frame.head(top_k)
+    return frame
+
+
+def workload_stats(counts):
+    """Distribution metrics over a vector of cases-per-manager counts.
+
+    Everything is derived from one sorted copy of the vector: quantiles, the
+    Gini coefficient (from the cumulative sums), the top-10% share and a log2
+    histogram (bin k holds managers with 2**k to 2**(k+1) - 1 cases).
+    """
+    x = np.sort(np.asarray(counts, dtype=np.float64))
+    n = len(x)
+    if n == 0 or x[-1] <= 0:
+        stats = {key: 0 for key, _ in STAT_LABELS}
+        stats.update(managers=n, histogram=[])
+        return stats
+
+    total = x.sum()
+    p25, median, p75, p90, p99 = np.quantile(x, [0.25, 0.5, 0.75, 0.9, 0.99])
+    cumulative = np.cumsum(x)
+    top = -(-n // 10)
+    bins = np.bincount(np.log2(np.maximum(x, 1)).astype(np.int64))
+    return {
+        "managers": n,
+        "total": int(total),
+        "mean": round(float(total / n), 2),
+        "median": round(float(median), 2),
+        "p25": round(float(p25), 2),
+        "p75": round(float(p75), 2),
+        "p90": round(float(p90), 2),
+        "p99": round(float(p99), 2),
+        "max": int(x[-1]),
+        "gini": round(float((n + 1 - 2 * cumulative.sum() / cumulative[-1]) / n), 4),
+        "top10_share": round(float(x[-top:].sum() / total), 4),
+        "histogram": [[histogram_label(k), int(c)] for k, c in enumerate(bins)],
+    }
+
+
+def histogram_label(k):
+    low, high = 2 ** k, 2 ** (k + 1) - 1
+    return str(low) if low == high else f"{low}-{high}"
+
+
+def summary_frame(frames):
+    """Workload metrics for each count table as one frame: a Metric column plus one per table."""
+    stats = [workload_stats(frame[COUNT_COL].to_numpy()) for frame in frames]
+    columns = [frame.columns[0] for frame in frames]
+    bins = max((len(s["histogram"]) for s in stats), default=0)
+
+    rows = [[label] + [s[key] for s in stats] for key, label in STAT_LABELS]
+    for k in range(bins):
+        label = f"Managers with {histogram_label(k)} case{'s' if k else ''}"
+        rows.append([label] + [s["histogram"][k][1] if k < len(s["histogram"]) else 0 for s in stats])
+    # object dtype keeps the integer metrics integral next to the ratios
+    return pd.DataFrame(rows, columns=["Metric"] + columns, dtype=object)
@@ -1,7 +1,43 @@
-from flask import Flask, render_template_string, request, send_file
-import pandas as pd
+import cProfile
+import importlib
+import importlib.util
+import operator
+import os
+import sys
+import time
+from functools import reduce
 from io import BytesIO
 
+from flask import Flask, Response, g, jsonify, render_template, request, send_file, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from columns import CASE_ID_COL
+from export import check_format, export_file_name, export_formats, export_mimetype, write_xlsx
+from metrics import REGISTRY, flush as flush_metrics, record, render as render_metrics, server_timing, start_collecting, stop_collecting, timed
+from result_store import RESULT_STORE
+from upload_spool import MB, SpooledUpload, close_uploads, open_upload, spool_upload, upload_data
+
+# With LAZY_IMPORTS=1 the pandas-backed modules load on first use, so a worker
+# that only serves the page shell, /healthz or /metrics never imports them
+LAZY_IMPORTS = os.environ.get("LAZY_IMPORTS") == "1"
+
+
+def lazy_import(name):
+    if not LAZY_IMPORTS or name in sys.modules:
+        return importlib.import_module(name)
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+analysis = lazy_import("analysis")
+count_store = lazy_import("count_store")
+jobs = lazy_import("jobs")
+upload_cache = lazy_import("upload_cache")
+
 app = Flask(__name__)
 
 HTML_TEMPLATE = '''
@@ -206,7 +242,7 @@ HTML_TEMPLATE = '''
         /* Stats ribbon */
         .stats-ribbon {
             display: grid;
-            grid-template-columns: repeat(3, 1fr);
+            grid-template-columns: repeat(auto-fit, minmax(150px, 1fr));
             gap: 16px;
             margin-bottom: 24px;
         }
@@ -285,6 +321,67 @@ HTML_TEMPLATE = '''
         tbody tr { transition: background 0.15s; }
         tbody tr:hover { background: #f8fafc; }
         tbody tr:last-child td { border-bottom: none; }
+        .table-scroll { overflow-x: auto; }
+        .table-scroll td, .table-scroll th { text-align: right; }
+        .table-scroll td:first-child, .table-scroll th:first-child { text-align: left; }
+        .btn-more {
+            display: block;
+            margin: 16px auto 0;
+            padding: 8px 20px;
+            border: 1px solid var(--border);
+            border-radius: 10px;
+            background: white;
+            color: var(--primary);
+            font-family: inherit;
+            font-size: 13px;
+            font-weight: 600;
+            cursor: pointer;
+        }
+        .btn-more:hover { background: #f8fafc; }
+        .notice-card {
+            background: #eff6ff;
+            border: 1px solid #bfdbfe;
+            border-radius: var(--radius);
+            padding: 16px 24px;
+            margin-bottom: 24px;
+            color: #1e40af;
+            font-size: 14px;
+            font-weight: 500;
+        }
+        .window-inputs {
+            display: flex;
+            gap: 12px;
+            flex-wrap: wrap;
+            margin-bottom: 20px;
+            font-size: 13px;
+            color: var(--text-secondary);
+        }
+        .window-inputs input {
+            margin-left: 6px;
+            padding: 8px 10px;
+            border: 2px solid var(--border);
+            border-radius: 10px;
+            font-family: inherit;
+        }
+        .inline-number {
+            width: 56px;
+            padding: 2px 6px;
+            border: 1px solid var(--border);
+            border-radius: 6px;
+            font-family: inherit;
+            font-size: 12px;
+        }
+        .table-filter {
+            width: 100%;
+            padding: 10px 14px;
+            margin-bottom: 12px;
+            border: 2px solid var(--border);
+            border-radius: 10px;
+            font-family: inherit;
+            font-size: 14px;
+        }
+        .table-filter:focus { outline: none; border-color: var(--primary); }
+        .files-note { font-size: 13px; color: var(--text-secondary); margin-bottom: 12px; }
 
         /* rank badges for top 3 */
         .rank { display: inline-flex; align-items: center; gap: 8px; }
@@ -316,12 +413,37 @@ HTML_TEMPLATE = '''
             text-align: center;
             padding: 28px;
         }
+        .download-section .format-select {
+            width: auto;
+            display: inline-block;
+            margin-right: 8px;
+            vertical-align: middle;
+        }
         .download-section p {
             font-size: 13px;
             color: var(--text-secondary);
             margin-top: 12px;
         }
 
+        /* Background jobs */
+        .form-group label.checkbox {
+            display: flex;
+            align-items: center;
+            gap: 8px;
+            font-weight: 500;
+            cursor: pointer;
+            margin-bottom: 4px;
+        }
+        .job-card { display: flex; align-items: center; gap: 16px; }
+        .job-text { font-size: 14px; color: var(--text-secondary); font-weight: 500; }
+        .spinner {
+            width: 22px; height: 22px; border-radius: 50%;
+            border: 3px solid var(--border);
+            border-top-color: var(--primary);
+            animation: spin 0.8s linear infinite;
+        }
+        @keyframes spin { to { transform: rotate(360deg); } }
+
         /* Error */
         .error-card {
             background: #fef2f2;
@@ -344,6 +466,7 @@ HTML_TEMPLATE = '''
             font-size: 13px;
         }
         .footer a { color: var(--primary); text-decoration: none; }
+        .hint a { color: var(--primary); text-decoration: none; }
 
         /* Animations */
         @keyframes fadeInUp {
@@ -379,24 +502,46 @@ HTML_TEMPLATE = '''
             <form method="POST" enctype="multipart/form-data" action="/analyze" id="uploadForm">
                 <div class="form-group">
                     <label for="file">Upload Excel File</label>
-                    <div class="hint">Accepted format: .xlsx</div>
+                    <div class="hint">Accepted formats: .xlsx, .csv, .parquet &middot; select several files to merge their counts{% if upload_token %} &middot; leave empty to re-analyze the last uploaded file{% endif %}</div>
                     <div class="file-upload-wrapper" id="dropZone">
-                        <input type="file" name="file" id="file" accept=".xlsx" required>
+                        <input type="file" name="file" id="file" accept=".xlsx,.csv,.parquet" multiple {% if not upload_token %}required{% endif %}>
                         <div class="file-upload-icon">📁</div>
                         <div class="file-upload-text"><strong>Click to upload</strong> or drag and drop</div>
                         <div class="file-name" id="fileName"></div>
                     </div>
                 </div>
 
+                {% if upload_token %}<input type="hidden" name="upload_token" value="{{ upload_token }}">{% endif %}
+
                 <div class="form-group">
                     <label for="analysis_type">Analysis Type</label>
                     <select name="analysis_type" id="analysis_type" class="custom-select">
                         <option value="Report Manager" {% if report_col == 'Report Manager' %}selected{% endif %}>📋 Report Manager</option>
                         <option value="Assigning Manager" {% if report_col == 'Assigning Manager' %}selected{% endif %}>👤 Assigning Manager</option>
                         <option value="Allotment Manager" {% if report_col == 'Allotment Manager' %}selected{% endif %}>📌 Allotment Manager</option>
+                        <option value="All analyses" {% if report_col == 'All analyses' %}selected{% endif %}>🗂️ All analyses</option>
                     </select>
                 </div>
 
+                <div class="form-group">
+                    <label class="checkbox"><input type="checkbox" name="background" value="1"> Run in the background</label>
+                    <div class="hint">Recommended for large files; the results appear here when they're ready</div>
+                    <label class="checkbox"><input type="checkbox" name="chunked" value="1" {% if config.CHUNKED_ANALYSIS %}checked{% endif %}> Low-memory mode</label>
+                    <input type="hidden" name="chunked" value="0">
+                    <div class="hint">Streams rows into running counts instead of loading the whole sheet</div>
+                    <label class="checkbox"><input type="checkbox" name="incremental" value="1"> Add to running totals</label>
+                    <div class="hint">Counts only cases not seen in earlier uploads (by {{ config.CASE_ID_COL }}) &middot; <a href="/totals">view running totals</a></div>
+                    <label class="checkbox"><input type="checkbox" name="crosstab" value="1"> Cross-tab</label>
+                    <div class="hint">Which report managers each manager's cases go to &middot; top <input type="number" name="crosstab_top" value="5" min="1" class="inline-number"> pairs per manager &middot; one file, not in low-memory mode</div>
+                    <label class="checkbox"><input type="checkbox" name="breakdown" value="1"> Per-file breakdown</label>
+                    <div class="hint">When several files are uploaded, also show each file's counts</div>
+                    <label class="checkbox"><input type="checkbox" name="all_sheets" value="1"> All sheets</label>
+                    <div class="hint">Analyze every sheet with a Manager column and show per-sheet counts next to the total</div>
+                    <label class="checkbox"><input type="checkbox" name="dedup" value="1" {% if config.DEDUP_CASES %}checked{% endif %}> Count each case once</label>
+                    <input type="hidden" name="dedup" value="0">
+                    <div class="hint">With several files or sheets, drop cases whose {{ config.CASE_ID_COL }} was already counted</div>
+                </div>
+
                 <button type="submit" class="btn btn-primary btn-block">
                     <svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2.5" stroke-linecap="round" stroke-linejoin="round"><circle cx="11" cy="11" r="8"/><path d="m21 21-4.35-4.35"/></svg>
                     Analyze
@@ -404,6 +549,13 @@ HTML_TEMPLATE = '''
             </form>
         </div>
 
+        {% if job_id %}
+        <div class="card job-card animate" id="jobCard" data-job-id="{{ job_id }}">
+            <div class="spinner"></div>
+            <div class="job-text" id="jobText">Analyzing your file&hellip;</div>
+        </div>
+        {% endif %}
+
         {% if error %}
         <div class="error-card animate">
             <div class="error-icon">⚠️</div>
@@ -411,35 +563,83 @@ HTML_TEMPLATE = '''
         </div>
         {% endif %}
 
-        {% if manager_cases is not none %}
+        {% if tables is not none %}
+        <div id="results" data-result-id="{{ result_id }}" data-page-size="{{ page_size }}"></div>
+        {% if window %}
+        <div class="card animate delay-1">
+            <form method="GET" action="/totals" class="window-form">
+                <input type="hidden" name="analysis_type" value="{{ report_col }}">
+                <div class="form-group">
+                    <label for="window">Time window</label>
+                    <select name="window" id="window" class="custom-select">
+                        {% for value, label in windows %}
+                        <option value="{{ value }}" {% if window.window == value %}selected{% endif %}>{{ label }}</option>
+                        {% endfor %}
+                    </select>
+                </div>
+                <div class="window-inputs">
+                    <label>Month <input type="month" name="month" value="{{ window.month }}"></label>
+                    <label>From <input type="date" name="start" value="{{ window.start }}"></label>
+                    <label>To <input type="date" name="end" value="{{ window.end }}"></label>
+                </div>
+                <button type="submit" class="btn btn-primary btn-block">Apply</button>
+            </form>
+        </div>
+        {% endif %}
+        {% if notice %}<div class="notice-card animate">ℹ️ {{ notice }}</div>{% endif %}
+        {% if files %}<div class="hint files-note animate">Combined counts from {{ files|length }} files: {{ files|join(', ') }}</div>{% endif %}
+        {% if sheets %}<div class="hint files-note animate">Combined counts from {{ sheets|length }} sheets: {{ sheets|join(', ') }}</div>{% endif %}
         <!-- Stats -->
         <div class="stats-ribbon animate delay-1">
             <div class="stat-card">
-                <div class="stat-value">{{ manager_cases|length }}</div>
+                <div class="stat-value">{{ tables[0].total }}</div>
                 <div class="stat-label">Managers</div>
             </div>
             <div class="stat-card">
                 <div class="stat-value">{{ total_cases }}</div>
                 <div class="stat-label">Total Cases</div>
             </div>
+            {% for table in tables[1:] %}
             <div class="stat-card">
-                <div class="stat-value">{{ other_cases|length }}</div>
-                <div class="stat-label">{{ report_col }}s</div>
+                <div class="stat-value">{{ table.total }}</div>
+                <div class="stat-label">{{ table.column }}s</div>
             </div>
+            {% endfor %}
         </div>
 
-        <!-- Manager Cases Table -->
+        <!-- Workload distribution -->
         <div class="card animate delay-2">
             <div class="table-header">
                 <div class="table-title">
-                    <span class="icon icon-blue">👔</span> Manager Cases
+                    <span class="icon icon-blue">📈</span> Workload Distribution
                 </div>
-                <span class="badge">{{ manager_cases|length }} managers</span>
+                <span class="badge">cases per manager</span>
             </div>
+            <div class="table-scroll">
             <table>
-                <thead><tr><th>Manager</th><th>Cases</th></tr></thead>
+                <thead><tr>{% for column in summary.columns %}<th>{{ column }}</th>{% endfor %}</tr></thead>
                 <tbody>
-                {% for row in manager_cases %}
+                {% for row in summary.rows %}
+                    <tr>{% for value in row %}<td>{{ value }}</td>{% endfor %}</tr>
+                {% endfor %}
+                </tbody>
+            </table>
+            </div>
+        </div>
+
+        {% for table in tables %}
+        <!-- {{ table.column }} Cases Table -->
+        <div class="card animate delay-{{ [loop.index + 1, 3]|min }}">
+            <div class="table-header">
+                <div class="table-title">
+                    {% if loop.first %}<span class="icon icon-blue">👔</span>{% else %}<span class="icon icon-teal">📊</span>{% endif %} {{ table.column }} Cases
+                </div>
+                <span class="badge">{{ table.total }} managers</span>
+            </div>
+            <table>
+                <thead><tr><th>{{ table.column }}</th><th>Cases</th></tr></thead>
+                <tbody data-max="{{ table.max }}">
+                {% for row in table.rows %}
                     <tr>
                         <td>
                             <span class="rank">
@@ -449,7 +649,7 @@ HTML_TEMPLATE = '''
                         </td>
                         <td>
                             <div class="case-count">
-                                <div class="count-bar" style="width: {{ (row[1] / max_manager * 100)|int }}px;"></div>
+                                <div class="count-bar" style="width: {{ (row[1] / table.max * 100)|int }}px;"></div>
                                 {{ row[1] }}
                             </div>
                         </td>
@@ -457,51 +657,73 @@ HTML_TEMPLATE = '''
                 {% endfor %}
                 </tbody>
             </table>
+            {% if table.rows|length < table.total %}
+            <button type="button" class="btn-more" data-kind="tables" data-index="{{ loop.index0 }}" data-total="{{ table.total }}">Show more</button>
+            {% endif %}
         </div>
+        {% endfor %}
 
-        <!-- Report/Assigning/Allotment Manager Cases Table -->
+        {% for table in breakdowns %}
+        <!-- {{ table.columns[0] }} per-{{ breakdown_by|lower }} breakdown -->
         <div class="card animate delay-3">
             <div class="table-header">
                 <div class="table-title">
-                    <span class="icon icon-teal">📊</span> {{ report_col }} Cases
+                    <span class="icon icon-teal">🗃️</span> {{ table.columns[0] }} by {{ breakdown_by }}
                 </div>
-                <span class="badge">{{ other_cases|length }} managers</span>
+                <span class="badge">{{ table.columns|length - 2 }} {{ breakdown_by|lower }}s</span>
             </div>
+            <div class="table-scroll">
             <table>
-                <thead><tr><th>{{ report_col }}</th><th>Cases</th></tr></thead>
+                <thead><tr>{% for column in table.columns %}<th>{{ column }}</th>{% endfor %}</tr></thead>
                 <tbody>
-                {% for row in other_cases %}
-                    <tr>
-                        <td>
-                            <span class="rank">
-                                {% if loop.index <= 3 %}<span class="rank-badge rank-{{ loop.index }}">{{ loop.index }}</span>{% endif %}
-                                {{ row[0] }}
-                            </span>
-                        </td>
-                        <td>
-                            <div class="case-count">
-                                <div class="count-bar" style="width: {{ (row[1] / max_other * 100)|int }}px;"></div>
-                                {{ row[1] }}
-                            </div>
-                        </td>
-                    </tr>
+                {% for row in table.rows %}
+                    <tr>{% for value in row %}<td>{{ value }}</td>{% endfor %}</tr>
+                {% endfor %}
+                </tbody>
+            </table>
+            </div>
+            {% if table.rows|length < table.total %}
+            <button type="button" class="btn-more" data-kind="breakdowns" data-index="{{ loop.index0 }}" data-total="{{ table.total }}">Show more</button>
+            {% endif %}
+        </div>
+        {% endfor %}
+
+        {% for table in crosstabs %}
+        <!-- {{ table.columns[0] }} x {{ table.columns[1] }} cross-tab -->
+        <div class="card animate delay-3">
+            <div class="table-header">
+                <div class="table-title">
+                    <span class="icon icon-blue">🔀</span> {{ table.columns[0] }} &rarr; {{ table.columns[1] }}
+                </div>
+                <span class="badge">{{ table.total }} pairs</span>
+            </div>
+            <input type="search" class="table-filter" placeholder="Filter by manager..." data-index="{{ loop.index0 }}">
+            <table>
+                <thead><tr>{% for column in table.columns %}<th>{{ column }}</th>{% endfor %}</tr></thead>
+                <tbody>
+                {% for row in table.rows %}
+                    <tr>{% for value in row %}<td>{{ value }}</td>{% endfor %}</tr>
                 {% endfor %}
                 </tbody>
             </table>
+            <button type="button" class="btn-more" data-kind="crosstabs" data-index="{{ loop.index0 }}" data-total="{{ table.total }}" {% if table.rows|length >= table.total %}hidden{% endif %}>Show more</button>
         </div>
+        {% endfor %}
 
         <!-- Download -->
         <div class="card download-section animate delay-4">
             <form method="POST" action="/download">
-                <input type="hidden" name="manager_data" value="{{ manager_data }}">
-                <input type="hidden" name="other_data" value="{{ other_data }}">
-                <input type="hidden" name="report_col" value="{{ report_col }}">
-                <input type="hidden" name="output_file" value="{{ output_file }}">
+                <input type="hidden" name="result_id" value="{{ result_id }}">
+                <select name="format" class="custom-select format-select" aria-label="Report format">
+                    {% for value, label in export_formats %}
+                    <option value="{{ value }}">{{ label }}</option>
+                    {% endfor %}
+                </select>
                 <button type="submit" class="btn btn-success">
                     <svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2.5" stroke-linecap="round" stroke-linejoin="round"><path d="M21 15v4a2 2 0 0 1-2 2H5a2 2 0 0 1-2-2v-4"/><polyline points="7 10 12 15 17 10"/><line x1="12" y1="15" x2="12" y2="3"/></svg>
                     Download Analysis Report
                 </button>
-                <p>Excel file with all analysis sheets</p>
+                <p>Excel workbook with all analysis sheets, or a zip with one Parquet, Arrow or CSV file per sheet</p>
             </form>
         </div>
         {% endif %}
@@ -517,7 +739,7 @@ HTML_TEMPLATE = '''
 
         fileInput.addEventListener('change', function() {
             if (this.files.length) {
-                fileName.textContent = '✅ ' + this.files[0].name;
+                fileName.textContent = '✅ ' + Array.from(this.files).map(function(f) { return f.name; }).join(', ');
                 fileName.style.display = 'block';
                 dropZone.style.borderColor = '#10b981';
                 dropZone.style.background = '#f0fdf4';
@@ -536,99 +758,531 @@ HTML_TEMPLATE = '''
         dropZone.addEventListener('drop', function() {
             this.classList.remove('dragover');
         });
+
+        // Fetch further pages of a result table on demand
+        const results = document.getElementById('results');
+        const cell = function(tag, className, text) {
+            const el = document.createElement(tag);
+            if (className) el.className = className;
+            if (text !== undefined) el.textContent = text;
+            return el;
+        };
+        document.querySelectorAll('.btn-more').forEach(function(button) {
+            const tbody = button.parentElement.querySelector('tbody');
+            button.addEventListener('click', function() {
+                const offset = tbody.rows.length;
+                const url = '/results/' + results.dataset.resultId + '/' + button.dataset.kind + '/' +
+                    button.dataset.index + '?offset=' + offset + '&limit=' + results.dataset.pageSize +
+                    '&q=' + encodeURIComponent(button.dataset.q || '');
+                button.disabled = true;
+                fetch(url).then(function(r) { return r.json(); }).then(function(page) {
+                    page.rows.forEach(function(row) {
+                        const tr = document.createElement('tr');
+                        if (button.dataset.kind === 'tables') {
+                            const name = cell('td');
+                            name.appendChild(cell('span', 'rank', row[0]));
+                            const count = cell('div', 'case-count');
+                            const bar = cell('div', 'count-bar');
+                            bar.style.width = Math.floor(row[1] / tbody.dataset.max * 100) + 'px';
+                            count.appendChild(bar);
+                            count.appendChild(document.createTextNode(row[1]));
+                            const value = cell('td');
+                            value.appendChild(count);
+                            tr.appendChild(name);
+                            tr.appendChild(value);
+                        } else {
+                            row.forEach(function(value) { tr.appendChild(cell('td', null, value)); });
+                        }
+                        tbody.appendChild(tr);
+                    });
+                    button.disabled = false;
+                    button.dataset.total = page.total;
+                    button.hidden = tbody.rows.length >= page.total;
+                }).catch(function() { button.disabled = false; });
+            });
+        });
+
+        // Cross-tab filters re-query the server and restart paging from the top
+        document.querySelectorAll('.table-filter').forEach(function(input) {
+            const card = input.parentElement;
+            const tbody = card.querySelector('tbody');
+            const button = card.querySelector('.btn-more');
+            let timer = null;
+            input.addEventListener('input', function() {
+                clearTimeout(timer);
+                timer = setTimeout(function() {
+                    tbody.innerHTML = '';
+                    button.dataset.q = input.value;
+                    button.hidden = false;
+                    button.click();
+                }, 250);
+            });
+        });
+
+        // Poll a background job until its result page is ready
+        const jobCard = document.getElementById('jobCard');
+        if (jobCard) {
+            const jobId = jobCard.dataset.jobId;
+            const poll = function() {
+                fetch('/jobs/' + jobId)
+                    .then(function(r) { return r.json(); })
+                    .then(function(job) {
+                        if (job.status === 'done') {
+                            window.location = '/jobs/' + jobId + '/result';
+                        } else if (job.status === 'failed' || job.status === 'unknown') {
+                            document.getElementById('jobText').textContent = '⚠️ ' + job.error;
+                            jobCard.querySelector('.spinner').style.display = 'none';
+                        } else {
+                            setTimeout(poll, 1000);
+                        }
+                    })
+                    .catch(function() { setTimeout(poll, 3000); });
+            };
+            poll();
+        }
     </script>
 </body>
 </html>
 '''
 
+# Compiled once at import instead of on every request
+PAGE = app.jinja_env.from_string(HTML_TEMPLATE)
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 100))
+MAX_PAGE_SIZE = 1000
+CROSSTAB_TOP = 5
+STREAM_BUFFER = 16
+app.config["STREAM_RESULTS"] = os.environ.get("STREAM_RESULTS") == "1"
+app.config["CHUNKED_ANALYSIS"] = os.environ.get("CHUNKED_ANALYSIS") == "1"
+app.config["CASE_ID_COL"] = CASE_ID_COL
+app.config["DEDUP_CASES"] = os.environ.get("DEDUP_CASES") == "1"
+# Larger request bodies are refused with 413 before anything is read
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_MB", 200)) * MB
+# With PROFILE_REQUESTS=1, a request with ?profile=1 is run under cProfile and dumped to PROFILE_DIR
+app.config["PROFILE_REQUESTS"] = os.environ.get("PROFILE_REQUESTS") == "1"
+app.config["PROFILE_DIR"] = os.environ.get("PROFILE_DIR", "profiles")
+
+@app.before_request
+def start_timing():
+    g.started = time.perf_counter()
+    g.timings = start_collecting()
+    g.profiler = None
+    if app.config["PROFILE_REQUESTS"] and request.args.get("profile") == "1":
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another request is already being profiled on this interpreter
+            return
+        g.profiler = profiler
+
+@app.after_request
+def finish_timing(response):
+    elapsed = time.perf_counter() - g.started
+    REGISTRY.observe("http_request_seconds", elapsed, "Request latency by endpoint.",
+                     endpoint=request.endpoint or "unknown", status=response.status_code)
+    # A streamed page is still rendering at this point, so its render time isn't included
+    timings = server_timing(g.timings + [("total", elapsed)])
+    response.headers["Server-Timing"] = timings
+
+    if g.profiler is not None:
+        g.profiler.disable()
+        os.makedirs(app.config["PROFILE_DIR"], exist_ok=True)
+        path = os.path.join(app.config["PROFILE_DIR"], f"{request.endpoint}-{time.time_ns()}.prof")
+        g.profiler.dump_stats(path)
+        g.profiler = None
+        response.headers["X-Profile"] = os.path.basename(path)
+    return response
+
+@app.teardown_request
+def stop_timing(error=None):
+    if getattr(g, "profiler", None) is not None:
+        g.profiler.disable()
+    stop_collecting()
+    # Shares this worker's numbers with the others when METRICS_DIR is set
+    flush_metrics()
+
+@app.teardown_request
+def close_request_uploads(error=None):
+    close_uploads(g.pop("uploads", []))
+
+def spool(file):
+    """Spool an upload; large ones go to a temp file, removed after the request unless handed to a job."""
+    with timed("upload"):
+        upload = spool_upload(file.stream)
+    if isinstance(upload, SpooledUpload):
+        record("upload", bytes=upload.size)
+        g.setdefault("uploads", []).append(upload)
+    else:
+        record("upload", bytes=len(upload))
+    return upload
+
+def hand_off(uploads):
+    """Leave ``uploads`` to the job they were submitted to, which closes them when it finishes."""
+    owned = g.get("uploads", [])
+    for upload in uploads:
+        if upload in owned:
+            owned.remove(upload)
+
+def read_upload(file):
+    """The upload's bytes, or a memory map of it when it was spooled to disk."""
+    return upload_data(spool(file))
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    message = f"The upload is larger than the {app.config['MAX_CONTENT_LENGTH'] // MB} MB limit."
+    if request.path.startswith("/api/"):
+        return jsonify(error=message), 413
+    return render_page(tables=None, error=message), 413
+
+@app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+FORMAT_LABELS = {
+    "xlsx": "Excel (.xlsx)",
+    "parquet": "Parquet (.zip)",
+    "arrow": "Arrow IPC (.zip)",
+    "csv": "CSV (.zip)",
+}
+
 @app.route("/")
 def home():
-    return render_template_string(HTML_TEMPLATE, manager_cases=None, error=None)
+    return render_page(tables=None, error=None)
+
+@app.route("/healthz")
+def healthz():
+    # Touches nothing heavy, so it stays cheap in a lazy-import worker
+    return jsonify(status="ok", engine_loaded="pandas" in sys.modules)
+
+def warm():
+    """Import the heavy modules and run a tiny upload through every stage.
+
+    Meant for the gunicorn master before it forks (see gunicorn.conf.py), so
+    workers start with pandas, the readers and writers and their lazy
+    imports already loaded and shared copy-on-write. Returns the seconds taken.
+    """
+    started = time.perf_counter()
+    frame = analysis.pd.DataFrame({analysis.MANAGER_COL: ["A", "B", "A"], analysis.REPORT_COLUMNS[0]: ["C", "D", "C"]})
+    data = write_xlsx([("Cases", frame)])
+    for upload in (data, frame.to_csv(index=False).encode()):
+        result = analysis.aggregate(analysis.parse_upload(upload), analysis.ALL_ANALYSES, crosstab_top=1)
+        analysis.build_report(result)
+    with app.test_request_context():
+        render_result("warm", result)
+    count_store.resolve_window("all")
+    # Attribute access is what loads a lazily imported module
+    jobs.JOBS
+    upload_cache.UPLOAD_CACHE
+    # Warm-up work isn't traffic
+    REGISTRY.clear()
+    seconds = time.perf_counter() - started
+    REGISTRY.set("app_warm_seconds", round(seconds, 6), "Time spent warming the app before serving.")
+    # Replaces the snapshot the warm-up request wrote when METRICS_DIR is set
+    flush_metrics()
+    return seconds
+
+def render_page(stream=False, **context):
+    """Render the compiled page, optionally streamed so the top of the page arrives first."""
+    if not stream:
+        with timed("render"):
+            return render_template(PAGE, **context)
+    app.update_template_context(context)
+    chunks = PAGE.stream(**context)
+    chunks.enable_buffering(STREAM_BUFFER)
+    return Response(stream_with_context(chunks), mimetype="text/html")
+
+def wants_stream():
+    value = request.values.get("stream")
+    return app.config["STREAM_RESULTS"] if value is None else value == "1"
+
+def _crosstab_top():
+    if not request.form.get("crosstab"):
+        return None
+    return max(request.form.get("crosstab_top", CROSSTAB_TOP, type=int) or CROSSTAB_TOP, 1)
+
+def _crosstab_conflict(files, chunked):
+    """The requested mode that can't produce a cross-tab, or None."""
+    if request.form.get("incremental"):
+        return "running totals"
+    if len(files) > 1:
+        return "several files"
+    if request.form.get("all_sheets"):
+        return "All sheets"
+    if chunked and files:
+        return "low-memory mode"
+    return None
+
+def wants_dedup():
+    value = request.values.get("dedup")
+    return app.config["DEDUP_CASES"] if value is None else value == "1"
+
+def wants_chunked():
+    value = request.values.get("chunked")
+    return app.config["CHUNKED_ANALYSIS"] if value is None else value == "1"
+
+def render_result(result_id, result, upload_token=None, stream=False):
+    # Only the first page of each table is rendered; the rest is fetched on demand
+    tables = []
+    for frame in result["frames"]:
+        tables.append({
+            "column": frame.columns[0],
+            "rows": frame.head(PAGE_SIZE).values.tolist(),
+            "total": len(frame),
+            "max": int(frame[analysis.COUNT_COL].max()) if len(frame) else 1,
+        })
+
+    breakdowns = [
+        {"columns": list(frame.columns), "rows": frame.head(PAGE_SIZE).values.tolist(), "total": len(frame)}
+        for frame in result.get("breakdowns", [])
+    ]
+    crosstabs = [
+        {"columns": list(frame.columns), "rows": frame.head(PAGE_SIZE).values.tolist(), "total": len(frame)}
+        for frame in result.get("crosstabs", [])
+    ]
+
+    summary = analysis.summary_frame(result["frames"])
+
+    return render_page(
+        stream=stream,
+        tables=tables,
+        summary={"columns": list(summary.columns), "rows": summary.values.tolist()},
+        breakdowns=breakdowns,
+        crosstabs=crosstabs,
+        files=result.get("files"),
+        sheets=result.get("sheets"),
+        breakdown_by=result.get("breakdown_by", "File"),
+        notice=result.get("notice"),
+        window=result.get("window"),
+        windows=WINDOWS,
+        report_col=result["report_col"],
+        result_id=result_id,
+        page_size=PAGE_SIZE,
+        total_cases=int(result["frames"][0][analysis.COUNT_COL].sum()),
+        upload_token=upload_token,
+        export_formats=[(name, FORMAT_LABELS[name]) for name in export_formats()],
+        error=None
+    )
 
 @app.route("/analyze", methods=["POST"])
 def analyze():
     try:
-        file = request.files.get("file")
+        files = [f for f in request.files.getlist("file") if f]
+        file = files[0] if files else None
         analysis_type = request.form.get("analysis_type")
+        token = request.form.get("upload_token")
+
+        chunked = wants_chunked()
+        crosstab_top = _crosstab_top()
+        if crosstab_top:
+            # The pairs are counted from a parsed frame, which these modes never build
+            conflict = _crosstab_conflict(files, chunked)
+            if conflict:
+                return render_page(tables=None, error=f"The cross-tab can't be combined with {conflict}.")
+
+        if request.form.get("incremental"):
+            return add_to_totals(files, token, analysis_type)
 
-        if not file:
-            return render_template_string(HTML_TEMPLATE, manager_cases=None, error="Please upload an Excel file.")
+        if len(files) > 1:
+            # Several workbooks: each one is parsed on its own pool worker and the counts merged
+            background = bool(request.form.get("background"))
+            uploads = [(f.filename, spool(f)) for f in files]
+            breakdown = bool(request.form.get("breakdown"))
+            if background:
+                job_id = jobs.JOBS.submit_batch(uploads, analysis_type, breakdown, wants_dedup())
+                hand_off(upload for _, upload in uploads)
+                return render_page(tables=None, job_id=job_id, report_col=analysis_type, error=None)
+            result = jobs.run_batch(uploads, analysis_type, breakdown, wants_dedup())
+            return render_result(RESULT_STORE.put(result), result, stream=wants_stream())
 
-        df = pd.read_excel(file, skiprows=1)
-        df.columns = df.columns.str.strip()
+        if file and request.form.get("all_sheets"):
+            # Every sheet with a Manager column, each parsed on its own pool worker
+            background = bool(request.form.get("background"))
+            upload = spool(file)
+            if background:
+                job_id = jobs.JOBS.submit_sheets(upload, analysis_type, wants_dedup())
+                hand_off([upload])
+                return render_page(tables=None, job_id=job_id, report_col=analysis_type, error=None)
+            result = jobs.run_sheets(upload, analysis_type, wants_dedup())
+            return render_result(RESULT_STORE.put(result), result, stream=wants_stream())
 
-        if analysis_type == "Report Manager":
-            df["Report Manager"] = df["Report Manager"].fillna(df["Manager"])
-            report_col = "Report Manager"
-            output_file = "manager_case_analysis_report.xlsx"
-        elif analysis_type == "Assigning Manager":
-            df["Assigning Manager"] = df["Assigning Manager"].fillna(df["Manager"])
-            report_col = "Assigning Manager"
-            output_file = "manager_case_analysis_assigning.xlsx"
+        if file and request.form.get("background"):
+            # Parse and aggregate on the process pool; the page polls /jobs/<id>
+            upload = spool(file)
+            job_id = jobs.JOBS.submit(upload, analysis_type, chunked, crosstab_top)
+            hand_off([upload])
+            return render_page(tables=None, job_id=job_id, report_col=analysis_type, error=None)
+
+        if file and chunked:
+            # Low-memory mode: stream rows from the upload into running counters
+            result = analysis.aggregate_stream(open_upload(read_upload(file)), analysis_type)
+            token = None
         else:
-            df["Allotment Manager"] = df["Allotment Manager"].fillna(df["Manager"])
-            report_col = "Allotment Manager"
-            output_file = "manager_case_analysis_allotment.xlsx"
-
-        manager_cases = df["Manager"].value_counts().reset_index()
-        manager_cases.columns = ["Manager", "Number of Cases"]
-
-        other_cases = df[report_col].value_counts().reset_index()
-        other_cases.columns = [report_col, "Number of Cases"]
-
-        # Convert to lists for template
-        manager_list = manager_cases.values.tolist()
-        other_list = other_cases.values.tolist()
-
-        # Encode data for download
-        import json
-        manager_data = json.dumps(manager_list)
-        other_data = json.dumps(other_list)
-
-        return render_template_string(
-            HTML_TEMPLATE,
-            manager_cases=manager_list,
-            other_cases=other_list,
-            report_col=report_col,
-            output_file=output_file,
-            manager_data=manager_data,
-            other_data=other_data,
-            total_cases=int(sum(r[1] for r in manager_list)),
-            max_manager=max(r[1] for r in manager_list) if manager_list else 1,
-            max_other=max(r[1] for r in other_list) if other_list else 1,
-            error=None
-        )
+            if file:
+                # A fresh upload is parsed once and then served from the cache by token
+                token, df = upload_cache.UPLOAD_CACHE.get_or_parse(read_upload(file))
+            else:
+                df = upload_cache.UPLOAD_CACHE.get(token) if token else None
+                if df is None:
+                    return render_page(tables=None, error="Please upload an Excel file.")
+            result = analysis.aggregate(df, analysis_type, crosstab_top=crosstab_top)
+
+        # Keep the frames server-side; the download form only carries the ID
+        result_id = RESULT_STORE.put(result)
+        return render_result(result_id, result, upload_token=token, stream=wants_stream())
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        return render_template_string(HTML_TEMPLATE, manager_cases=None, error=str(e))
+        return render_page(tables=None, error=str(e))
 
-@app.route("/download", methods=["POST"])
-def download():
-    import json
+def add_to_totals(files, token, analysis_type):
+    """Fold the uploads' new cases into the running totals and show the cumulative tables."""
+    store = count_store.get_store()
+    frames = [upload_cache.UPLOAD_CACHE.get_or_parse(read_upload(f))[1] for f in files]
+    if not frames and token and upload_cache.UPLOAD_CACHE.get(token) is not None:
+        frames = [upload_cache.UPLOAD_CACHE.get(token)]
+    added = {"new": 0, "duplicates": 0, "missing_id": 0}
+    for df in frames:
+        for key, n in store.add(df).items():
+            added[key] += n
+
+    result = store.result(analysis_type)
+    notice = f"{added['new']} new cases added to the running totals, {added['duplicates']} already counted"
+    if added["missing_id"]:
+        notice += f", {added['missing_id']} skipped without a {CASE_ID_COL}"
+    result["notice"] = notice + "."
+    return render_result(RESULT_STORE.put(result), result)
+
+WINDOWS = [
+    ("all", "All time"),
+    ("last_7", "Last 7 days"),
+    ("previous_7", "Previous 7 days"),
+    ("last_30", "Last 30 days"),
+    ("this_month", "This month"),
+    ("last_month", "Last month"),
+    ("month", "Month..."),
+    ("custom", "Custom range..."),
+]
+
+@app.route("/totals")
+def totals():
+    try:
+        store = count_store.get_store()
+        window = {key: request.args.get(key) or "" for key in ("window", "month", "start", "end")}
+        start, end, label = count_store.resolve_window(window["window"], window["month"], window["start"], window["end"])
+        # Windowed tables are summed from per-day rollups, never from the case rows
+        result = store.result(request.args.get("analysis_type"), start, end)
+        result["notice"] = f"Running totals for {label}: {store.total_cases(start, end)} distinct cases."
+        result["window"] = window
+        return render_result(RESULT_STORE.put(result), result)
+    except Exception as e:
+        return render_page(tables=None, error=str(e))
+
+def _int_arg(name):
+    value = request.values.get(name)
+    if value in (None, ""):
+        return None
+    value = int(value)
+    if value < 0:
+        raise ValueError(f"{name} must not be negative")
+    return value
+
+@app.route("/api/analyze", methods=["POST"])
+def api_analyze():
     try:
-        manager_data = json.loads(request.form.get("manager_data"))
-        other_data = json.loads(request.form.get("other_data"))
-        report_col = request.form.get("report_col")
-        output_file = request.form.get("output_file")
+        top_k = _int_arg("top_k")
+        min_cases = _int_arg("min_cases")
+    except ValueError as e:
+        return jsonify(error=f"Invalid parameter: {e}"), 400
 
-        manager_cases = pd.DataFrame(manager_data, columns=["Manager", "Number of Cases"])
-        other_cases = pd.DataFrame(other_data, columns=[report_col, "Number of Cases"])
+    try:
+        file = request.files.get("file")
+        token = request.values.get("upload_token")
+        if file:
+            token, df = upload_cache.UPLOAD_CACHE.get_or_parse(read_upload(file))
+        else:
+            df = upload_cache.UPLOAD_CACHE.get(token) if token else None
+            if df is None:
+                return jsonify(error="Please upload an Excel file."), 400
 
-        buffer = BytesIO()
-        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-            manager_cases.to_excel(writer, sheet_name="Manager Cases", index=False)
-            other_cases.to_excel(writer, sheet_name=f"{report_col} Cases", index=False)
+        result = analysis.aggregate(df, request.values.get("analysis_type"))
+        frames = result["frames"]
+    except Exception as e:
+        return jsonify(error=str(e)), 400
+
+    # Filter before serializing so large tables never leave the server
+    tables = []
+    for frame in frames:
+        tables.append({
+            "column": frame.columns[0],
+            "managers": len(frame),
+            "rows": analysis.limit_counts(frame, top_k, min_cases).values.tolist(),
+            "stats": analysis.workload_stats(frame[analysis.COUNT_COL].to_numpy()),
+        })
+    return jsonify(
+        analysis_type=result["report_col"],
+        total_cases=int(frames[0][analysis.COUNT_COL].sum()),
+        upload_token=token,
+        tables=tables,
+    )
+
+@app.route("/results/<result_id>/<kind>/<int:index>")
+def result_rows(result_id, kind, index):
+    result = RESULT_STORE.get(result_id)
+    frames = result.get("frames" if kind == "tables" else kind, []) if result else []
+    if kind not in ("tables", "breakdowns", "crosstabs") or index >= len(frames):
+        return jsonify(error="This analysis has expired. Please run it again."), 404
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = max(min(request.args.get("limit", PAGE_SIZE, type=int), MAX_PAGE_SIZE), 1)
+    frame = frames[index]
+    query = request.args.get("q", "").strip()
+    if query:
+        # Match the name columns only, not the counts; names may be numeric IDs
+        names = frame.columns[:2] if kind == "crosstabs" else frame.columns[:1]
+        matches = [frame[column].astype(str).str.contains(query, case=False, regex=False) for column in names]
+        frame = frame[reduce(operator.or_, matches)]
+    rows = frame.iloc[offset:offset + limit].values.tolist()
+    return jsonify(rows=rows, total=len(frame))
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    status = jobs.JOBS.status(job_id)
+    if status is None:
+        return jsonify(status="unknown", error="This job has expired. Please run it again."), 404
+    return jsonify(status)
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    result = RESULT_STORE.get(job_id)
+    if result is None:
+        status = jobs.JOBS.status(job_id) or {}
+        error = status.get("error") or "This job has not finished or has expired."
+        return render_page(tables=None, error=error)
+    return render_result(job_id, result)
+
+@app.route("/download", methods=["POST"])
+def download():
+    try:
+        result_id = request.form.get("result_id", "")
+        format = request.form.get("format", "xlsx")
+        try:
+            check_format(format)
+        except ValueError as e:
+            return str(e), 400
+        # Each format is built once per result and then served from the store
+        stored = RESULT_STORE.get_export(result_id, format, lambda r: analysis.build_report(r, format))
+        if stored is None:
+            return "This analysis has expired. Please run it again.", 404
+        data, output_file = stored
 
-        buffer.seek(0)
         return send_file(
-            buffer,
+            BytesIO(data),
             as_attachment=True,
-            download_name=output_file,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            download_name=export_file_name(output_file, format),
+            mimetype=export_mimetype(format)
         )
     except Exception as e:
         return f"Error generating download: {e}", 500
 
 if __name__ == "__main__":
-    import os
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
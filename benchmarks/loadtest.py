@@ -0,0 +1,378 @@
+"""Load-test the Flask app under gunicorn to size a deployment.
+
+For every worker class x worker count the app is started locally with
+gunicorn.conf.py, and a fixed number of sessions is replayed at the given
+concurrency. A session uploads a synthetic workbook to /analyze and, for a
+share of them, downloads the report from /download. Reported per
+configuration:
+
+* p50/p95/p99 latency and error counts for /analyze and /download;
+* throughput (requests and analyses per second of wall time);
+* peak RSS (VmHWM) of the master and of every worker.
+
+Every response other than 200 counts as an error and is listed by status;
+a 404 from /download means the worker that answered couldn't find the result.
+/analyze shows failures as a 200 error page, so a 200 without a result is
+counted as a "no_result" error. Errors are left out of the latency figures.
+
+    python benchmarks/loadtest.py --worker-classes sync,gthread --workers 1,2,4 \\
+        --concurrency 16 --sessions 300 --rows 2000,20000 --output loadtest_results.json
+
+Linux only (RSS is read from /proc). Worker classes whose module isn't
+installed, such as gevent, are skipped.
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import math
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import FORMATS, workbook_bytes  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_ID = re.compile(r'name="result_id" value="([^"]+)"')
+
+# Module each gunicorn worker class needs besides gunicorn itself
+WORKER_MODULES = {"gevent": "gevent", "eventlet": "eventlet", "tornado": "tornado"}
+
+# Download formats the app can build without optional packages
+DOWNLOAD_FORMATS = ("xlsx", "parquet", "arrow", "csv")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of ``samples`` (q in 0-100)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def multipart(fields, files):
+    """(body, content type) for a multipart/form-data POST."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def proc_status(pid, field):
+    """A kB field of /proc/<pid>/status, or None once the process is gone."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+    found = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces; the parent PID follows it
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        found.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return found
+
+
+class RssMonitor(threading.Thread):
+    """Tracks the peak RSS of the gunicorn master and every worker it forks.
+
+    Workers that are restarted mid-run keep their own entry, so a recycled
+    worker still shows up with the peak it reached.
+    """
+
+    def __init__(self, master, interval=0.2):
+        super().__init__(daemon=True)
+        self.master = master
+        self.interval = interval
+        self.peaks = {}
+        self._done = threading.Event()
+
+    def sample(self):
+        for pid in [self.master, *children(self.master)]:
+            peak = proc_status(pid, "VmHWM")
+            if peak is not None:
+                self.peaks[pid] = max(peak, self.peaks.get(pid, 0))
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.sample()
+
+    def report(self):
+        workers = {pid: kb for pid, kb in self.peaks.items() if pid != self.master}
+        return {
+            "master_mb": round(self.peaks.get(self.master, 0) / 1024, 1),
+            "workers_mb": {str(pid): round(kb / 1024, 1) for pid, kb in sorted(workers.items())},
+            "max_worker_mb": round(max(workers.values(), default=0) / 1024, 1),
+            "total_mb": round(sum(self.peaks.values()) / 1024, 1),
+        }
+
+
+class Server:
+    """gunicorn running app:app with gunicorn.conf.py on a free local port."""
+
+    def __init__(self, worker_class, workers, threads, preload, env=None, startup_timeout=60):
+        self.port = free_port()
+        self.workers = workers
+        self.startup_timeout = startup_timeout
+        self.log = tempfile.NamedTemporaryFile(prefix="loadtest-gunicorn-", suffix=".log", delete=False)
+        # Shared results, parsed uploads and metrics start empty for every configuration
+        self.state = tempfile.TemporaryDirectory(prefix="loadtest-state-")
+        self.env = {
+            **os.environ,
+            **(env or {}),
+            "PORT": str(self.port),
+            "WEB_CONCURRENCY": str(workers),
+            "WORKER_CLASS": worker_class,
+            "WORKER_THREADS": str(threads),
+            "PRELOAD_APP": "1" if preload else "0",
+            "RESULT_STORE_PATH": os.path.join(self.state.name, "results.sqlite3"),
+            "UPLOAD_CACHE_DIR": os.path.join(self.state.name, "uploads"),
+            "METRICS_DIR": os.path.join(self.state.name, "metrics"),
+            "COUNT_STORE_PATH": os.path.join(self.state.name, "counts.sqlite3"),
+        }
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+            cwd=ROOT, env=self.env, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+        try:
+            self.wait_ready()
+        except Exception:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log.close()
+        os.remove(self.log.name)
+        self.state.cleanup()
+
+    def tail(self, lines=20):
+        with open(self.log.name, errors="replace") as f:
+            return "".join(f.readlines()[-lines:])
+
+    def wait_ready(self):
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {self.process.returncode}:\n{self.tail()}")
+            if len(children(self.process.pid)) >= self.workers:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+                try:
+                    conn.request("GET", "/healthz")
+                    if conn.getresponse().status == 200:
+                        return
+                except OSError:
+                    pass
+                finally:
+                    conn.close()
+            time.sleep(0.1)
+        raise RuntimeError(f"gunicorn wasn't ready after {self.startup_timeout}s:\n{self.tail()}")
+
+
+class Client:
+    """Replays analyze/download sessions against one server and records each request."""
+
+    def __init__(self, port, uploads, analysis_type, download_share, download_formats, timeout, seed):
+        self.port = port
+        self.uploads = uploads
+        self.analysis_type = analysis_type
+        self.download_share = download_share
+        self.download_formats = download_formats
+        self.timeout = timeout
+        self.seed = seed
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def post(self, conn, endpoint, fields, files=None, check=None):
+        """POST and record the sample; a 200 whose body fails ``check`` is recorded as "no_result"."""
+        body, content_type = multipart(fields, files or {})
+        start = time.perf_counter()
+        try:
+            conn.request("POST", endpoint, body=body, headers={"Content-Type": content_type})
+            response = conn.getresponse()
+            payload = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            payload, status = b"", type(e).__name__
+        elapsed = time.perf_counter() - start
+        if status == 200 and check is not None and not check(payload):
+            status = "no_result"
+        with self._lock:
+            self.samples.append((endpoint, status, elapsed))
+        return status, payload
+
+    def session(self, n):
+        rng = random.Random(self.seed + n)
+        name, data = rng.choice(self.uploads)
+        # One keep-alive connection per session, like a browser tab
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+        try:
+            # /analyze answers 200 with an error page when the analysis fails
+            status, page = self.post(conn, "/analyze", {"analysis_type": self.analysis_type}, {"file": (name, data)},
+                                     check=lambda page: RESULT_ID.search(page.decode(errors="replace")))
+            if status == 200 and rng.random() < self.download_share:
+                result_id = RESULT_ID.search(page.decode(errors="replace")).group(1)
+                self.post(conn, "/download", {"result_id": result_id, "format": rng.choice(self.download_formats)})
+        finally:
+            conn.close()
+
+    def run(self, sessions, concurrency):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            start = time.perf_counter()
+            list(pool.map(self.session, range(sessions)))
+            return time.perf_counter() - start
+
+
+def summarize(samples, wall):
+    report = {}
+    for endpoint in ("/analyze", "/download"):
+        rows = [(status, seconds) for name, status, seconds in samples if name == endpoint]
+        ok = [seconds for status, seconds in rows if status == 200]
+        errors = {}
+        for status, _ in rows:
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+        report[endpoint] = {
+            "requests": len(rows),
+            "ok": len(ok),
+            "errors": errors,
+            **{f"p{q}_ms": None if not ok else round(percentile(ok, q) * 1000, 1) for q in (50, 95, 99)},
+            "max_ms": None if not ok else round(max(ok) * 1000, 1),
+        }
+    report["wall_s"] = round(wall, 3)
+    report["requests_per_s"] = round(len(samples) / wall, 2)
+    report["analyses_per_s"] = round(report["/analyze"]["ok"] / wall, 2)
+    return report
+
+
+def run_config(worker_class, workers, args, uploads):
+    threads = args.threads if worker_class == "gthread" else 1
+    with Server(worker_class, workers, threads, not args.no_preload, startup_timeout=args.startup_timeout) as server:
+        monitor = RssMonitor(server.process.pid)
+        monitor.sample()
+        monitor.start()
+        client = Client(server.port, uploads, args.analysis_type, args.download_share,
+                        args.download_formats.split(","), args.timeout, args.seed)
+        if args.warmup:
+            client.run(args.warmup, min(args.warmup, args.concurrency))
+            client.samples.clear()
+        wall = client.run(args.sessions, args.concurrency)
+        monitor.stop()
+    report = summarize(client.samples, wall)
+    report["rss"] = monitor.report()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--worker-classes", default="sync,gthread", help="comma-separated gunicorn worker classes")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--threads", type=int, default=4, help="threads per gthread worker")
+    parser.add_argument("--no-preload", action="store_true", help="let every worker import the app itself")
+    parser.add_argument("--concurrency", type=int, default=8, help="sessions in flight at once")
+    parser.add_argument("--sessions", type=int, default=100, help="sessions per configuration")
+    parser.add_argument("--warmup", type=int, default=4, help="sessions run and discarded before measuring")
+    parser.add_argument("--rows", default="2000,20000", help="comma-separated upload sizes, picked at random")
+    parser.add_argument("--upload-format", default="xlsx", choices=FORMATS)
+    parser.add_argument("--managers", type=int, default=200)
+    parser.add_argument("--analysis-type", default="Report Manager")
+    parser.add_argument("--download-share", type=float, default=0.5, help="share of sessions that also download")
+    parser.add_argument("--download-formats", default="xlsx", help=f"comma-separated, from {', '.join(DOWNLOAD_FORMATS)}")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="loadtest_results.json")
+    args = parser.parse_args(argv)
+
+    uploads = [
+        (f"cases_{rows}.{args.upload_format}", workbook_bytes(rows, args.managers, seed=args.seed, format=args.upload_format))
+        for rows in (int(n) for n in args.rows.split(","))
+    ]
+    results = {
+        "parameters": {name: value for name, value in vars(args).items() if name != "output"},
+        "uploads": {name: len(data) for name, data in uploads},
+        "configs": [],
+    }
+    for worker_class in args.worker_classes.split(","):
+        module = WORKER_MODULES.get(worker_class)
+        if module and importlib.util.find_spec(module) is None:
+            print(f"{worker_class}: skipped, {module} is not installed")
+            results["configs"].append({"worker_class": worker_class, "skipped": f"{module} is not installed"})
+            continue
+        for workers in (int(n) for n in args.workers.split(",")):
+            label = f"{worker_class} x{workers}" + (f" ({args.threads} threads)" if worker_class == "gthread" else "")
+            print(f"{label}: {args.sessions} sessions at concurrency {args.concurrency}...", flush=True)
+            report = run_config(worker_class, workers, args, uploads)
+            results["configs"].append({"worker_class": worker_class, "workers": workers, **report})
+            for endpoint in ("/analyze", "/download"):
+                stats = report[endpoint]
+                errors = ", ".join(f"{k} {v}" for k, v in stats["errors"].items()) or "none"
+                print(f"  {endpoint:<9} n={stats['requests']:<4} p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, "
+                      f"p99 {stats['p99_ms']} ms, errors: {errors}")
+            rss = report["rss"]
+            print(f"  {report['requests_per_s']} req/s, {report['analyses_per_s']} analyses/s; "
+                  f"peak RSS master {rss['master_mb']} MB, max worker {rss['max_worker_mb']} MB, total {rss['total_mb']} MB")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Time the analysis pipeline on synthetic workbooks and save the numbers as JSON.
+
+Each scenario (row count x format) is timed two ways:
+
+* in-process: parse, aggregate, render and export called directly, each
+  stage on its own;
+* through the Flask test client: POST /analyze then POST /download, with the
+  per-stage split taken from the Server-Timing header.
+
+Every measurement is repeated and the min, median and max kept. Compare two
+result files to spot regressions:
+
+    python benchmarks/run.py --rows 10000,100000 --output before.json
+    python benchmarks/run.py --rows 10000,100000 --output after.json --compare before.json
+
+The app's result store, upload cache, count store and metrics live in a
+temporary directory for the run, so benchmarking never touches the state of
+a deployment in the working directory.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Set before the app modules are imported, as they read these at import time
+STATE = tempfile.TemporaryDirectory(prefix="benchmark-state-")
+os.environ.update({
+    "RESULT_STORE_PATH": os.path.join(STATE.name, "results.sqlite3"),
+    "UPLOAD_CACHE_DIR": os.path.join(STATE.name, "uploads"),
+    "METRICS_DIR": os.path.join(STATE.name, "metrics"),
+    "COUNT_STORE_PATH": os.path.join(STATE.name, "counts.sqlite3"),
+})
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from analysis import aggregate, build_report, parse_upload  # noqa: E402
+from export import best_xlsx_writer  # noqa: E402
+from synthetic import FORMATS, workbook_bytes  # noqa: E402
+
+RESULT_ID = re.compile(r'name="result_id" value="([^"]+)"')
+
+
+def summarize(samples):
+    return {
+        "min": round(min(samples), 6),
+        "median": round(statistics.median(samples), 6),
+        "max": round(max(samples), 6),
+    }
+
+
+def time_call(fn, repeat):
+    """(samples in seconds, last return value) for ``repeat`` calls of ``fn``."""
+    samples = []
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        samples.append(time.perf_counter() - start)
+    return samples, value
+
+
+def bench_in_process(data, analysis_type, repeat):
+    from app import app, render_result
+
+    timings = {}
+    samples, df = time_call(lambda: parse_upload(data), repeat)
+    timings["parse"] = summarize(samples)
+    samples, result = time_call(lambda: aggregate(df, analysis_type), repeat)
+    timings["aggregate"] = summarize(samples)
+    with app.test_request_context():
+        samples, _ = time_call(lambda: render_result("benchmark", result), repeat)
+    timings["render"] = summarize(samples)
+    samples, _ = time_call(lambda: build_report(result), repeat)
+    timings["export"] = summarize(samples)
+    return timings
+
+
+def _server_timing(header):
+    stages = {}
+    for part in header.split(","):
+        name, _, duration = part.strip().partition(";dur=")
+        if duration:
+            stages[name] = float(duration) / 1000
+    return stages
+
+
+def bench_flask(data, format, analysis_type, repeat):
+    from app import app
+    from upload_cache import UPLOAD_CACHE
+
+    client = app.test_client()
+    requests = {"analyze": [], "download": []}
+    stages = {}
+    for _ in range(repeat):
+        # A warm upload cache would skip the parse being measured
+        UPLOAD_CACHE.clear()
+        start = time.perf_counter()
+        response = client.post("/analyze", data={
+            "file": (BytesIO(data), f"cases.{format}"),
+            "analysis_type": analysis_type,
+        })
+        requests["analyze"].append(time.perf_counter() - start)
+        page = response.get_data(as_text=True)
+        match = RESULT_ID.search(page)
+        if response.status_code != 200 or match is None:
+            raise RuntimeError(f"/analyze failed with status {response.status_code}")
+        for name, seconds in _server_timing(response.headers.get("Server-Timing", "")).items():
+            stages.setdefault(f"analyze.{name}", []).append(seconds)
+
+        start = time.perf_counter()
+        response = client.post("/download", data={"result_id": match.group(1)})
+        requests["download"].append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"/download failed with status {response.status_code}")
+        for name, seconds in _server_timing(response.headers.get("Server-Timing", "")).items():
+            stages.setdefault(f"download.{name}", []).append(seconds)
+
+    timings = {name: summarize(samples) for name, samples in requests.items()}
+    timings["stages"] = {name: summarize(samples) for name, samples in stages.items()}
+    return timings
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "xlsx_writer": best_xlsx_writer(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results, baseline):
+    """Print median time ratios against a baseline results file."""
+    old = {(s["rows"], s["format"]): s for s in baseline["scenarios"]}
+    print(f"\nCompared with {baseline['environment'].get('commit') or 'baseline'} (ratio < 1 is faster):")
+    for scenario in results["scenarios"]:
+        before = old.get((scenario["rows"], scenario["format"]))
+        if before is None:
+            continue
+        for mode in ("in_process", "flask"):
+            for name, timing in scenario[mode].items():
+                if name == "stages" or name not in before[mode]:
+                    continue
+                ratio = timing["median"] / max(before[mode][name]["median"], 1e-9)
+                flag = "  <-- slower" if ratio > 1.1 else ""
+                print(f"  {scenario['rows']:>9} {scenario['format']:<8} {mode:<10} {name:<10} {ratio:6.2f}x{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="10000,100000", help="comma-separated row counts")
+    parser.add_argument("--formats", default="xlsx", help=f"comma-separated, from {', '.join(FORMATS)}")
+    parser.add_argument("--managers", type=int, default=200)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--null-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--analysis-type", default="Report Manager")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    results = {
+        "environment": environment(),
+        "parameters": {
+            "managers": args.managers,
+            "skew": args.skew,
+            "null_rate": args.null_rate,
+            "seed": args.seed,
+            "analysis_type": args.analysis_type,
+            "repeat": args.repeat,
+        },
+        "scenarios": [],
+    }
+    for format in args.formats.split(","):
+        for rows in (int(n) for n in args.rows.split(",")):
+            data = workbook_bytes(rows, args.managers, args.skew, args.null_rate, args.seed, format)
+            print(f"{rows} rows, {format} ({len(data):,} bytes)...", flush=True)
+            scenario = {
+                "rows": rows,
+                "format": format,
+                "bytes": len(data),
+                "in_process": bench_in_process(data, args.analysis_type, args.repeat),
+                "flask": bench_flask(data, format, args.analysis_type, args.repeat),
+            }
+            for mode in ("in_process", "flask"):
+                line = ", ".join(f"{name} {t['median'] * 1000:.1f} ms" for name, t in scenario[mode].items() if name != "stages")
+                print(f"  {mode}: {line}")
+            results["scenarios"].append(scenario)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Measure cold-start cost: importing the app and serving the first requests.
+
+Each mode runs in a fresh interpreter, the way a newly forked or recycled
+worker would start:
+
+* eager: the default imports, nothing warmed;
+* lazy: LAZY_IMPORTS=1, so pandas loads on the first request that needs it;
+* warmed: the default imports plus app.warm(), as the preloading gunicorn
+  master does before forking.
+
+    python benchmarks/startup.py --repeat 5 --output startup_results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import workbook_bytes  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "eager": ({}, False),
+    "lazy": ({"LAZY_IMPORTS": "1"}, False),
+    "warmed": ({}, True),
+}
+
+# Runs in the child interpreter; prints one JSON object of timings in seconds
+CHILD = """
+import json, sys, time
+from io import BytesIO
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+timings = {{"import": time.perf_counter() - started}}
+if {warm}:
+    timings["warm"] = app.warm()
+client = app.app.test_client()
+data = open({upload!r}, "rb").read()
+for name, call in [
+    ("first_home", lambda: client.get("/")),
+    ("first_healthz", lambda: client.get("/healthz")),
+    ("first_analyze", lambda: client.post("/analyze", data={{"file": (BytesIO(data), "cases.xlsx"), "analysis_type": "Report Manager"}})),
+    ("second_analyze", lambda: client.post("/analyze", data={{"file": (BytesIO(data), "cases.xlsx"), "analysis_type": "Assigning Manager"}})),
+]:
+    start = time.perf_counter()
+    assert call().status_code == 200, name
+    timings[name] = time.perf_counter() - start
+timings["ready"] = timings["import"] + timings.get("warm", 0)
+print(json.dumps(timings))
+"""
+
+
+def run_mode(env, warm, upload):
+    code = CHILD.format(root=ROOT, warm=warm, upload=upload)
+    output = subprocess.run([sys.executable, "-c", code], env={**os.environ, **env}, cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000, help="rows in the uploaded workbook")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="startup_results.json")
+    args = parser.parse_args(argv)
+
+    upload = os.path.join(ROOT, f".startup_upload_{os.getpid()}.xlsx")
+    with open(upload, "wb") as f:
+        f.write(workbook_bytes(args.rows))
+    try:
+        results = {"rows": args.rows, "repeat": args.repeat, "modes": {}}
+        for mode, (env, warm) in MODES.items():
+            runs = [run_mode(env, warm, upload) for _ in range(args.repeat)]
+            medians = {name: round(statistics.median(run[name] for run in runs), 6) for name in runs[0]}
+            results["modes"][mode] = medians
+            print(f"{mode:>7}: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in medians.items()))
+    finally:
+        os.remove(upload)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
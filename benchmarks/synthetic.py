@@ -0,0 +1,107 @@
+"""Synthetic case workbooks for the benchmarks.
+
+The layout matches a real export: a one-row preamble, then the header row with
+Case ID, Created Date, Manager and the three report manager columns. The
+report columns are left blank at ``null_rate`` so the Manager fallback is
+exercised. Managers are drawn from a Zipf-like distribution: ``skew`` 0 is
+uniform, larger values pile the cases onto the first few managers.
+
+    python benchmarks/synthetic.py cases.xlsx --rows 100000 --managers 200 --skew 1.1
+"""
+import argparse
+import os
+import sys
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from workbook_reader import CASE_ID_COL, CREATED_COL, MANAGER_COL, REPORT_COLUMNS  # noqa: E402
+
+FORMATS = ("xlsx", "csv", "parquet")
+PREAMBLE = "Case export"
+
+
+def case_frame(rows, managers=50, skew=1.0, null_rate=0.3, seed=0):
+    """The synthetic cases as a frame, in the order the columns appear in the sheet."""
+    rng = np.random.default_rng(seed)
+    names = np.array([f"Manager {i:04d}" for i in range(managers)], dtype=object)
+    weights = 1.0 / np.arange(1, managers + 1) ** skew
+    weights /= weights.sum()
+
+    frame = {
+        CASE_ID_COL: [f"C{i:08d}" for i in range(rows)],
+        CREATED_COL: pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), unit="D"),
+        MANAGER_COL: names[rng.choice(managers, rows, p=weights)],
+    }
+    for column in REPORT_COLUMNS:
+        values = names[rng.choice(managers, rows, p=weights)]
+        values[rng.random(rows) < null_rate] = None
+        frame[column] = values
+    return pd.DataFrame(frame)
+
+
+def _xlsx_bytes(df):
+    import xlsxwriter
+
+    buffer = BytesIO()
+    wb = xlsxwriter.Workbook(buffer, {"constant_memory": True})
+    ws = wb.add_worksheet("Cases")
+    date_format = wb.add_format({"num_format": "yyyy-mm-dd"})
+    ws.write_row(0, 0, [PREAMBLE])
+    ws.write_row(1, 0, list(df.columns))
+    columns = [df[column].tolist() for column in df.columns]
+    dates = df.columns.get_loc(CREATED_COL)
+    for index, row in enumerate(zip(*columns), start=2):
+        for col, value in enumerate(row):
+            if pd.isna(value):
+                continue
+            if col == dates:
+                ws.write_datetime(index, col, value.to_pydatetime(), date_format)
+            else:
+                ws.write_string(index, col, value)
+    wb.close()
+    return buffer.getvalue()
+
+
+def _csv_bytes(df):
+    return (PREAMBLE + "\n" + df.to_csv(index=False)).encode()
+
+
+def _parquet_bytes(df):
+    # Parquet has no room for a preamble row; the header is the schema
+    buffer = BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def workbook_bytes(rows, managers=50, skew=1.0, null_rate=0.3, seed=0, format="xlsx"):
+    """A synthetic upload in ``format`` (xlsx, csv or parquet), as bytes."""
+    df = case_frame(rows, managers, skew, null_rate, seed)
+    return {"xlsx": _xlsx_bytes, "csv": _csv_bytes, "parquet": _parquet_bytes}[format](df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--managers", type=int, default=50)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--null-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=FORMATS)
+    args = parser.parse_args(argv)
+
+    format = args.format or os.path.splitext(args.path)[1].lstrip(".") or "xlsx"
+    if format not in FORMATS:
+        parser.error(f"can't tell the format from '{args.path}', pass --format")
+    data = workbook_bytes(args.rows, args.managers, args.skew, args.null_rate, args.seed, format)
+    with open(args.path, "wb") as f:
+        f.write(data)
+    print(f"Wrote {args.rows} cases to {args.path} ({len(data):,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
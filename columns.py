@@ -0,0 +1,13 @@
+"""Names of the upload columns the analysis works with.
+
+Kept free of heavy imports so light code paths (the page shell, health
+checks) can use them without loading pandas.
+"""
+import os
+
+MANAGER_COL = "Manager"
+REPORT_COLUMNS = ["Report Manager", "Assigning Manager", "Allotment Manager"]
+# Column that identifies a case across uploads (used to skip cases already counted)
+CASE_ID_COL = os.environ.get("CASE_ID_COL", "Case ID")
+# Case creation date, used for time-windowed running totals
+CREATED_COL = os.environ.get("CREATED_COL", "Created Date")
@@ -0,0 +1,208 @@
+import os
+import sqlite3
+from contextlib import closing
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from analysis import ALL_ANALYSES, COUNT_COL, count_all, filled_columns, resolve_analysis
+from dedup import case_key
+from manager_names import canonicalize_counts
+from workbook_reader import CASE_ID_COL, CREATED_COL, MANAGER_COL, REPORT_COLUMNS
+
+DEFAULT_PATH = os.environ.get("COUNT_STORE_PATH", "case_counts.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    case_id TEXT PRIMARY KEY,
+    case_day TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counts (
+    column_name TEXT NOT NULL,
+    manager TEXT NOT NULL,
+    cases INTEGER NOT NULL,
+    PRIMARY KEY (column_name, manager)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_counts (
+    column_name TEXT NOT NULL,
+    day TEXT NOT NULL,
+    manager TEXT NOT NULL,
+    cases INTEGER NOT NULL,
+    PRIMARY KEY (column_name, day, manager)
+) WITHOUT ROWID;
+"""
+
+UPSERT = {
+    "counts": (
+        "INSERT INTO counts VALUES (?, ?, ?) "
+        "ON CONFLICT (column_name, manager) DO UPDATE SET cases = cases + excluded.cases"
+    ),
+    "daily_counts": (
+        "INSERT INTO daily_counts VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (column_name, day, manager) DO UPDATE SET cases = cases + excluded.cases"
+    ),
+}
+
+
+def case_days(df):
+    """ISO day of each row's creation date, or None when it's missing or unparseable."""
+    if CREATED_COL not in df.columns:
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    dates = pd.to_datetime(df[CREATED_COL], errors="coerce", format="mixed")
+    return dates.dt.strftime("%Y-%m-%d").astype(object).where(dates.notna(), None)
+
+
+def resolve_window(window, month=None, start=None, end=None, today=None):
+    """Turn a window choice into (first day, last day, label); (None, None, ...) means all time.
+
+    ``window`` is one of "all", "last_7", "previous_7", "last_30", "this_month",
+    "last_month", "month" (``month`` as YYYY-MM) or "custom" (``start``/``end``
+    as YYYY-MM-DD, either may be open).
+    """
+    today = today or date.today()
+    if window == "last_7":
+        return today - timedelta(days=6), today, "the last 7 days"
+    if window == "previous_7":
+        return today - timedelta(days=13), today - timedelta(days=7), "the 7 days before that"
+    if window == "last_30":
+        return today - timedelta(days=29), today, "the last 30 days"
+    if window == "this_month":
+        return today.replace(day=1), today, "this month"
+    if window == "last_month":
+        last = today.replace(day=1) - timedelta(days=1)
+        return last.replace(day=1), last, "last month"
+    if window == "month" and month:
+        first = datetime.strptime(month, "%Y-%m").date()
+        following = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return first, following - timedelta(days=1), first.strftime("%B %Y")
+    if window == "custom" and (start or end):
+        first = date.fromisoformat(start) if start else None
+        last = date.fromisoformat(end) if end else None
+        if first and last:
+            return first, last, f"{start} to {end}"
+        return first, last, f"from {start}" if first else f"up to {end}"
+    return None, None, "all time"
+
+
+class CountStore:
+    """Running per-manager case counts persisted in SQLite.
+
+    Every counted case ID is kept in an indexed table, so re-uploading a file
+    that grows day by day only adds the cases that weren't seen before.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        with closing(self._connect()) as db, db:
+            db.executescript(SCHEMA)
+            # Stores created before case dates were tracked lack the case_day column
+            if "case_day" not in [row[1] for row in db.execute("PRAGMA table_info(cases)")]:
+                db.execute("ALTER TABLE cases ADD COLUMN case_day TEXT")
+            db.execute("CREATE INDEX IF NOT EXISTS cases_by_day ON cases (case_day)")
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def add(self, df):
+        """Count the cases in ``df`` that aren't in the store yet.
+
+        Returns {"new": n, "duplicates": n, "missing_id": n}. Rows without a case
+        ID can't be deduplicated and are left out.
+        """
+        if CASE_ID_COL not in df.columns:
+            raise ValueError(f"Running totals need a '{CASE_ID_COL}' column in the uploaded file.")
+
+        ids = df[CASE_ID_COL]
+        has_id = ids.notna()
+        keyed = df[has_id].assign(_key=[case_key(v) for v in ids[has_id]])
+        unique = keyed.drop_duplicates("_key")
+
+        with closing(self._connect()) as db, db:
+            # Take the write lock up front so concurrent adds wait on the busy timeout;
+            # a deferred read-then-write transaction fails at once with "database is locked"
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("CREATE TEMP TABLE incoming (case_id TEXT PRIMARY KEY, position INTEGER) WITHOUT ROWID")
+            db.executemany("INSERT INTO incoming VALUES (?, ?)", zip(unique["_key"], range(len(unique))))
+            # Each lookup hits the cases primary-key index
+            positions = [row[0] for row in db.execute(
+                "SELECT position FROM incoming WHERE case_id NOT IN (SELECT case_id FROM cases)"
+            )]
+            fresh = unique.iloc[sorted(positions)]
+            days = case_days(fresh)
+            db.executemany("INSERT INTO cases VALUES (?, ?)", zip(fresh["_key"], days))
+
+            for column, frame in count_all(fresh).items():
+                db.executemany(
+                    UPSERT["counts"],
+                    ((column, str(name), int(n)) for name, n in frame.itertuples(index=False)),
+                )
+
+            # Per-day rollups, so any date window is a sum over days rather than cases
+            dated = days.notna()
+            for column, managers in filled_columns(fresh[dated]).items():
+                rolled = pd.DataFrame({"day": days[dated], "manager": managers}).dropna().value_counts()
+                db.executemany(
+                    UPSERT["daily_counts"],
+                    ((column, day, str(name), int(n)) for (day, name), n in rolled.items()),
+                )
+            db.execute("DROP TABLE incoming")
+
+        return {
+            "new": len(fresh),
+            "duplicates": int(has_id.sum()) - len(fresh),
+            "missing_id": int((~has_id).sum()),
+        }
+
+    def table(self, column, start=None, end=None):
+        """Cumulative counts for one column, largest first.
+
+        With ``start``/``end`` (dates, inclusive, either may be None) the counts
+        are summed from the per-day rollups in that window instead.
+        """
+        if start is None and end is None:
+            query = "SELECT manager, cases FROM counts WHERE column_name = ? ORDER BY cases DESC, manager"
+            params = (column,)
+        else:
+            query = (
+                "SELECT manager, SUM(cases) AS total FROM daily_counts "
+                "WHERE column_name = ? AND day BETWEEN ? AND ? "
+                "GROUP BY manager ORDER BY total DESC, manager"
+            )
+            params = (column, str(start or date.min), str(end or date.max))
+        with closing(self._connect()) as db:
+            rows = db.execute(query, params).fetchall()
+        # Uploads are canonicalized one at a time, so a variant may have been stored
+        # under a different spelling by another upload; merge them on read
+        return canonicalize_counts([pd.DataFrame(rows or None, columns=[column, COUNT_COL])])[0]
+
+    def total_cases(self, start=None, end=None):
+        with closing(self._connect()) as db:
+            if start is None and end is None:
+                return db.execute("SELECT COUNT(*) FROM cases").fetchone()[0]
+            return db.execute(
+                "SELECT COUNT(*) FROM cases WHERE case_day BETWEEN ? AND ?",
+                (str(start or date.min), str(end or date.max)),
+            ).fetchone()[0]
+
+    def result(self, analysis_type, start=None, end=None):
+        """Cumulative count tables for ``analysis_type``, shaped like analysis.aggregate's result."""
+        report_col, output_file = resolve_analysis(analysis_type)
+        columns = [MANAGER_COL] + (REPORT_COLUMNS if report_col == ALL_ANALYSES else [report_col])
+        return {
+            "frames": [self.table(column, start, end) for column in columns],
+            "report_col": report_col,
+            "output_file": output_file.replace(".xlsx", "_cumulative.xlsx"),
+        }
+
+
+_store = None
+
+
+def get_store():
+    """The process-wide store, opened on first use."""
+    global _store
+    if _store is None:
+        _store = CountStore()
+    return _store
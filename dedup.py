@@ -0,0 +1,106 @@
+"""Case-level deduplication across the uploads of one analysis.
+
+Overlapping exports repeat cases, so batch and multi-sheet analyses can drop
+every row whose case ID (CASE_ID_COL) was already seen in an earlier file,
+sheet or row. Seen IDs live in an in-memory set; past DEDUP_MEMORY_IDS they
+are moved to a temporary SQLite index on disk, so memory stays bounded for
+very large sets without the false positives a Bloom filter would add to the
+counts.
+"""
+import os
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from columns import CASE_ID_COL
+
+DEDUP_MEMORY_IDS = int(os.environ.get("DEDUP_MEMORY_IDS", 5_000_000))
+
+
+def case_key(value):
+    """Normalize a case ID so 123, 123.0 and " 123 " are the same case."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+class CaseDeduper:
+    """Filters frames down to the cases it hasn't seen yet.
+
+    ``dropped`` counts the duplicate rows removed so far and ``missing_id`` the
+    rows kept without a case ID (those can't be matched). Use one deduper per
+    analysis and close it afterwards to remove any spill file.
+    """
+
+    def __init__(self, memory_limit=DEDUP_MEMORY_IDS, column=CASE_ID_COL):
+        self.memory_limit = memory_limit
+        self.column = column
+        self.dropped = 0
+        self.missing_id = 0
+        self._seen = set()
+        self._db = None
+        self._path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            os.remove(self._path)
+
+    def filter(self, df):
+        """The rows of ``df`` whose case ID is new; rows without an ID are kept."""
+        if self.column not in df.columns or not len(df):
+            self.missing_id += len(df)
+            return df
+        ids = df[self.column]
+        has_id = ids.notna().to_numpy()
+        keys = pd.Index([case_key(v) for v in ids[has_id]])
+        # First occurrence within this frame...
+        fresh = ~keys.duplicated()
+        # ...and not seen in an earlier one
+        candidates = keys[fresh].tolist()
+        fresh[fresh] = ~self._seen_before(candidates)
+        self._remember(keys[fresh].tolist())
+
+        keep = ~has_id
+        keep[has_id] = fresh
+        self.dropped += int(len(fresh) - fresh.sum())
+        self.missing_id += int((~has_id).sum())
+        return df[keep]
+
+    def _seen_before(self, keys):
+        if self._db is None:
+            return np.fromiter(map(self._seen.__contains__, keys), dtype=bool, count=len(keys))
+        self._db.execute("DELETE FROM batch")
+        self._db.executemany("INSERT INTO batch VALUES (?, ?)", enumerate(keys))
+        seen = np.zeros(len(keys), dtype=bool)
+        positions = [row[0] for row in self._db.execute("SELECT position FROM batch JOIN seen USING (case_id)")]
+        seen[positions] = True
+        return seen
+
+    def _remember(self, keys):
+        if self._db is None and len(self._seen) + len(keys) <= self.memory_limit:
+            self._seen.update(keys)
+            return
+        if self._db is None:
+            self._spill()
+        self._db.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((k,) for k in keys))
+
+    def _spill(self):
+        fd, self._path = tempfile.mkstemp(prefix="case-ids-", suffix=".sqlite3")
+        os.close(fd)
+        self._db = sqlite3.connect(self._path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("CREATE TABLE seen (case_id TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._db.execute("CREATE TABLE batch (position INTEGER PRIMARY KEY, case_id TEXT)")
+        self._db.executemany("INSERT INTO seen VALUES (?)", ((k,) for k in self._seen))
+        self._seen = set()
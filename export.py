@@ -0,0 +1,184 @@
+import os
+import re
+import zipfile
+from functools import lru_cache
+from io import BytesIO
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_MIMETYPE = "application/zip"
+
+
+def report_sheets(frames, breakdowns=(), crosstabs=(), breakdown_by="File"):
+    """(sheet name, frame) pairs for the analysis report, one sheet per count table.
+
+    Per-file (or per-sheet) breakdowns follow as "<column> by File" sheets,
+    and cross-tab pair tables as "Manager x <column>" sheets.
+    """
+    sheets = [(f"{frame.columns[0]} Cases", frame) for frame in frames]
+    sheets += [(f"{frame.columns[0]} by {breakdown_by}", frame) for frame in breakdowns]
+    sheets += [(f"{frame.columns[0]} x {frame.columns[1]}", frame) for frame in crosstabs]
+    return sheets
+
+
+def _rows(frame):
+    # Column-wise tolist() hands the writers plain Python scalars instead of numpy ones
+    return zip(*(frame[column].tolist() for column in frame.columns))
+
+
+def _write_xlsxwriter(sheets):
+    import xlsxwriter
+
+    buffer = BytesIO()
+    # constant_memory flushes each row to disk as soon as the next one starts
+    wb = xlsxwriter.Workbook(buffer, {"constant_memory": True})
+    for name, frame in sheets:
+        ws = wb.add_worksheet(name)
+        ws.write_row(0, 0, [str(c) for c in frame.columns])
+        for index, row in enumerate(_rows(frame), start=1):
+            ws.write_row(index, 0, row)
+    wb.close()
+    return buffer.getvalue()
+
+
+def _write_openpyxl(sheets):
+    from openpyxl import Workbook
+
+    # write_only streams rows straight into the sheet XML without a cell model
+    wb = Workbook(write_only=True)
+    for name, frame in sheets:
+        ws = wb.create_sheet(name)
+        ws.append([str(c) for c in frame.columns])
+        for row in _rows(frame):
+            ws.append(row)
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _write_pandas(sheets):
+    import pandas as pd
+
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        for name, frame in sheets:
+            frame.to_excel(writer, sheet_name=name, index=False)
+    return buffer.getvalue()
+
+
+# Fastest first, keyed by the module each writer needs; the first importable one is used
+XLSX_WRITERS = {
+    "xlsxwriter": _write_xlsxwriter,
+    "openpyxl": _write_openpyxl,
+    "pandas": _write_pandas,
+}
+
+
+@lru_cache(maxsize=None)
+def _available(module):
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+def best_xlsx_writer():
+    """Name of the xlsx writer to use; XLSX_WRITER in the environment overrides the choice."""
+    preferred = os.environ.get("XLSX_WRITER")
+    if preferred:
+        if preferred not in XLSX_WRITERS:
+            raise ValueError(f"Unknown XLSX_WRITER '{preferred}', expected one of: {', '.join(XLSX_WRITERS)}")
+        return preferred
+    return next(name for name in XLSX_WRITERS if _available(name))
+
+
+def write_xlsx(sheets, writer=None):
+    """Serialize (sheet name, frame) pairs to xlsx bytes."""
+    return XLSX_WRITERS[writer or best_xlsx_writer()](sheets)
+
+
+# Columnar formats hold one table per file, so the report becomes a zip with
+# one member per sheet. Members are stored uncompressed: Parquet compresses its
+# own pages, and a stored Arrow file can be memory-mapped straight out of the
+# archive by the consumer.
+
+def member_name(sheet_name, extension):
+    return re.sub(r"[^0-9a-z]+", "_", sheet_name.lower()).strip("_") + "." + extension
+
+
+def _write_members(sheets, extension, write):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, frame in sheets:
+            archive.writestr(member_name(name, extension), write(frame))
+    return buffer.getvalue()
+
+
+def _arrow_table(frame):
+    import pyarrow as pa
+
+    # The Summary sheet's object columns mix ints and floats; they become float64
+    frame = frame.infer_objects()
+    # What is still object holds names, which may mix text with numeric cells
+    names = frame.select_dtypes(include="object").columns
+    if len(names):
+        frame = frame.assign(**{c: frame[c].where(frame[c].isna(), frame[c].astype(str)) for c in names})
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+def _parquet_bytes(frame):
+    import pyarrow.parquet as pq
+
+    buffer = BytesIO()
+    pq.write_table(_arrow_table(frame), buffer)
+    return buffer.getvalue()
+
+
+def _arrow_bytes(frame):
+    import pyarrow as pa
+
+    table = _arrow_table(frame)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _csv_bytes(frame):
+    return frame.to_csv(index=False).encode("utf-8")
+
+
+# Format -> (writer, file extension, mimetype, module the writer needs)
+EXPORT_FORMATS = {
+    "xlsx": (write_xlsx, "xlsx", XLSX_MIMETYPE, None),
+    "parquet": (lambda sheets: _write_members(sheets, "parquet", _parquet_bytes), "parquet.zip", ZIP_MIMETYPE, "pyarrow"),
+    "arrow": (lambda sheets: _write_members(sheets, "arrow", _arrow_bytes), "arrow.zip", ZIP_MIMETYPE, "pyarrow"),
+    "csv": (lambda sheets: _write_members(sheets, "csv", _csv_bytes), "csv.zip", ZIP_MIMETYPE, None),
+}
+
+
+def export_formats():
+    """The export formats this install can write; Parquet and Arrow need pyarrow."""
+    return [name for name, (_, _, _, module) in EXPORT_FORMATS.items() if module is None or _available(module)]
+
+
+def check_format(format):
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{format}', expected one of: {', '.join(EXPORT_FORMATS)}")
+    if format not in export_formats():
+        raise ValueError(f"The {format} export needs {EXPORT_FORMATS[format][3]}, which is not installed.")
+
+
+def write_export(sheets, format="xlsx"):
+    """Serialize (sheet name, frame) pairs in ``format`` (see EXPORT_FORMATS)."""
+    check_format(format)
+    return EXPORT_FORMATS[format][0](sheets)
+
+
+def export_file_name(output_file, format):
+    """``output_file`` (an .xlsx name) with the extension for ``format``."""
+    return os.path.splitext(output_file)[0] + "." + EXPORT_FORMATS[format][1]
+
+
+def export_mimetype(format):
+    return EXPORT_FORMATS[format][2]
@@ -0,0 +1,59 @@
+"""Gunicorn settings for the Flask app:  gunicorn -c gunicorn.conf.py app:app
+
+By default the app is loaded and warmed in the master (PRELOAD_APP=1): pandas,
+the workbook readers and writers and the compiled template are loaded once,
+a tiny upload is run through every stage, and the heap is frozen before
+forking so workers share it copy-on-write instead of each paying for the
+imports on their first /analyze. Startup times are written to the log.
+
+With PRELOAD_APP=0 every worker imports the app itself; combine it with
+LAZY_IMPORTS=1 so workers that only answer / and /healthz stay light.
+
+Workers share their metrics through METRICS_DIR (default metrics/, emptied
+when the master starts), so /metrics reports every worker whichever one
+answers the scrape.
+"""
+import gc
+import os
+import time
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+# One worker unless asked for more. Results, job status, parsed uploads and
+# metrics are shared through files in the working directory, so extra workers
+# must run on the same host and in the same directory.
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+worker_class = os.environ.get("WORKER_CLASS", "sync")
+threads = int(os.environ.get("WORKER_THREADS", 1))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 120))
+preload_app = os.environ.get("PRELOAD_APP", "1") == "1"
+
+# Set before the app is imported, so metrics.py picks it up in the master and the workers
+os.environ.setdefault("METRICS_DIR", "metrics")
+
+_started = time.perf_counter()
+
+
+def on_starting(server):
+    import metrics
+
+    # Snapshots left by an earlier run would be counted again
+    metrics.reset_shared()
+
+
+def when_ready(server):
+    # Runs in the master after the (preloaded) app is imported, before any worker forks
+    if preload_app:
+        import app
+
+        server.log.info("App warmed in %.3fs", app.warm())
+        # Keep the warmed objects out of the collector so forked workers don't touch (and copy) their pages
+        gc.freeze()
+    server.log.info("Master ready in %.3fs", time.perf_counter() - _started)
+
+
+def pre_fork(server, worker):
+    worker.fork_started = time.perf_counter()
+
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s booted in %.3fs", worker.pid, time.perf_counter() - worker.fork_started)
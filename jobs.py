@@ -0,0 +1,220 @@
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from analysis import ALL_ANALYSES, analyze_upload, count_cases, merge_counts, parse_upload, resolve_analysis
+from columns import CASE_ID_COL
+from dedup import CaseDeduper
+from result_store import RESULT_STORE
+from upload_spool import close_uploads, mapped, open_upload, upload_data, upload_payload
+from workbook_reader import MANAGER_COL, find_sheets
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", min(4, os.cpu_count() or 1)))
+
+_pool = None
+_pool_lock = threading.Lock()
+_coordinator = ThreadPoolExecutor(max_workers=2, thread_name_prefix="batch")
+
+
+def get_pool():
+    """The shared process pool, created on first use so it isn't inherited across forks."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+        return _pool
+
+
+def _reset_pool(broken):
+    """Drop ``broken`` so the next get_pool() starts a fresh pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def submit(fn, *args):
+    """Submit ``fn(*args)`` to the shared pool.
+
+    A pool process that dies (e.g. OOM-killed on a huge upload) leaves the
+    executor broken for good, so it is replaced and the call retried once.
+    """
+    pool = get_pool()
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        return get_pool().submit(fn, *args)
+
+
+def count_upload(payload, report_col, sheet=None):
+    """Parse one workbook (or one of its sheets) and return its count tables; runs inside a pool worker."""
+    with mapped(payload) as data:
+        return count_cases(parse_upload(data, sheet), report_col)
+
+
+def parse_payload(payload, sheet=None):
+    """Parse one workbook (or sheet) into a frame; runs inside a pool worker."""
+    with mapped(payload) as data:
+        return parse_upload(data, sheet)
+
+
+def analyze_payload(payload, analysis_type, chunked=False, crosstab_top=None):
+    with mapped(payload) as data:
+        return analyze_upload(data, analysis_type, chunked, crosstab_top)
+
+
+def _gather(futures, describe):
+    results = []
+    for name, future in futures:
+        try:
+            results.append((name, future.result()))
+        except Exception as e:
+            raise ValueError(f"{describe(name)}: {e}") from e
+    return results
+
+
+def _count_parts(parts, report_col, dedup, describe):
+    """Count tables for each (name, payload, sheet) part, parsed in parallel on the pool.
+
+    Without ``dedup`` the workers count and only the small tables come back.
+    With it they return the parsed frames, which are deduplicated on the case
+    ID in part order (first occurrence wins) and counted here. Returns
+    (named frames, notice or None).
+    """
+    if not dedup:
+        futures = [(name, submit(count_upload, payload, report_col, sheet)) for name, payload, sheet in parts]
+        return _gather(futures, describe), None
+
+    futures = [(name, submit(parse_payload, payload, sheet)) for name, payload, sheet in parts]
+    named_frames = []
+    with CaseDeduper() as deduper:
+        for name, df in _gather(futures, describe):
+            named_frames.append((name, count_cases(deduper.filter(df), report_col)))
+    notice = f"{deduper.dropped} duplicate cases dropped (same {CASE_ID_COL} seen earlier)"
+    if deduper.missing_id:
+        notice += f"; {deduper.missing_id} rows without a {CASE_ID_COL} were kept"
+    return named_frames, notice + "."
+
+
+def run_batch(uploads, analysis_type, breakdown=False, dedup=False):
+    """Analyze several workbooks in parallel and merge their counts.
+
+    ``uploads`` is a list of (file name, bytes or SpooledUpload). Each workbook
+    is parsed on its own pool worker; spooled uploads are passed by path, never
+    copied to the workers. With ``dedup``, a case that appears in several files
+    is counted once.
+    """
+    report_col, output_file = resolve_analysis(analysis_type)
+    parts = [(name, upload_payload(upload), None) for name, upload in uploads]
+    named_frames, notice = _count_parts(parts, report_col, dedup, str)
+    frames, breakdowns = merge_counts(named_frames)
+    return {
+        "frames": frames,
+        "breakdowns": breakdowns if breakdown else [],
+        "report_col": report_col,
+        "output_file": output_file.replace(".xlsx", "_batch.xlsx"),
+        "files": [name for name, _ in uploads],
+        "notice": notice,
+    }
+
+
+def run_sheets(upload, analysis_type, dedup=False):
+    """Analyze every sheet of a workbook that has the Manager and report columns, in parallel.
+
+    Each sheet is parsed on its own pool worker. The result carries the merged
+    totals plus a per-sheet breakdown of every table. With ``dedup``, a case
+    that appears on several sheets is counted once.
+    """
+    report_col, output_file = resolve_analysis(analysis_type)
+    # A sheet without the selected report column is left out rather than failing the rest
+    required = [MANAGER_COL] if report_col == ALL_ANALYSES else [MANAGER_COL, report_col]
+    sheets = find_sheets(open_upload(upload_data(upload)), required)
+    payload = upload_payload(upload)
+    parts = [(sheet, payload, sheet) for sheet in sheets]
+    named_frames, notice = _count_parts(parts, report_col, dedup, lambda sheet: f"Sheet '{sheet}'")
+    frames, breakdowns = merge_counts(named_frames)
+    return {
+        "frames": frames,
+        "breakdowns": breakdowns,
+        "breakdown_by": "Sheet",
+        "report_col": report_col,
+        "output_file": output_file.replace(".xlsx", "_sheets.xlsx"),
+        "sheets": sheets,
+        "notice": notice,
+    }
+
+
+class JobQueue:
+    """Tracks analysis jobs submitted to the process pool.
+
+    A job's status lives in the shared result store, so any worker can answer
+    /jobs/<id>, and its finished result is stored there under the job ID,
+    which doubles as the result ID for rendering and /download. The futures
+    only exist in the worker that submitted the jobs. A job owns the uploads
+    it is given and closes any spooled ones when it finishes.
+    """
+
+    def __init__(self, results=RESULT_STORE):
+        self.results = results
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, upload, analysis_type, chunked=False, crosstab_top=None):
+        future = submit(analyze_payload, upload_payload(upload), analysis_type, chunked, crosstab_top)
+        return self._track(future, [upload])
+
+    def submit_batch(self, uploads, analysis_type, breakdown=False, dedup=False):
+        # run_batch fans out to the process pool itself, so it is coordinated from a thread
+        future = _coordinator.submit(run_batch, uploads, analysis_type, breakdown, dedup)
+        return self._track(future, [upload for _, upload in uploads])
+
+    def submit_sheets(self, upload, analysis_type, dedup=False):
+        future = _coordinator.submit(run_sheets, upload, analysis_type, dedup)
+        return self._track(future, [upload])
+
+    def _track(self, future, uploads=()):
+        job_id = secrets.token_urlsafe(16)
+        self.results.set_job(job_id, "queued")
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f, uploads))
+        return job_id
+
+    def _finish(self, job_id, future, uploads=()):
+        close_uploads(uploads)
+        try:
+            if future.cancelled():
+                self.results.set_job(job_id, "failed", "The job was cancelled.")
+            elif future.exception() is not None:
+                self.results.set_job(job_id, "failed", str(future.exception()))
+            else:
+                self.results.put(future.result(), job_id)
+                self.results.set_job(job_id, "done")
+        except Exception as e:
+            self.results.set_job(job_id, "failed", str(e))
+        finally:
+            with self._lock:
+                self._futures.pop(job_id, None)
+
+    def status(self, job_id):
+        """{"status": ...} for the job, or None when the ID is unknown or expired."""
+        job = self.results.get_job(job_id)
+        if job is None:
+            return None
+        status, error = job
+        if status == "failed":
+            return {"status": "failed", "error": error}
+        if status == "done":
+            return {"status": "done"}
+        # Only the worker that submitted the job can tell queued from running
+        future = self._futures.get(job_id)
+        if future is not None and not future.done() and not future.running():
+            return {"status": "queued"}
+        return {"status": "running"}
+
+
+JOBS = JobQueue()
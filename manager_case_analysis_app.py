@@ -1,67 +1,105 @@
-import streamlit as st
-import pandas as pd
+import os
 from io import BytesIO
 
+import streamlit as st
+
+from analysis import ALL_ANALYSES, aggregate, aggregate_stream, build_report, parse_upload, summary_frame
+from export import export_file_name, export_formats, export_mimetype
+from jobs import run_sheets
+from manager_names import alias_version
+from metrics import collect_timings, timed
+from upload_cache import upload_token
+
 st.set_page_config(page_title="Manager Case Analysis", layout="centered")
 
+
+# Streamlit reruns this script on every interaction. The stages below are
+# cached on the upload's content hash and the alias file version (the raw
+# bytes are passed as an unhashed "_data" argument), so changing the
+# selectbox or clicking download doesn't read or aggregate the workbook again.
+
+@st.cache_resource(max_entries=8, show_spinner="Reading workbook...")
+def parse_cached(token, _data):
+    # Shared, read-only frame; cache_resource avoids copying it on every hit
+    return parse_upload(_data)
+
+
+@st.cache_data(max_entries=64, show_spinner="Counting cases...")
+def aggregate_cached(token, analysis_type, chunked, all_sheets, _data):
+    if all_sheets:
+        return run_sheets(_data, analysis_type)
+    if chunked:
+        return aggregate_stream(BytesIO(_data), analysis_type)
+    return aggregate(parse_cached(token, _data), analysis_type)
+
+
+@st.cache_data(max_entries=64, show_spinner="Building report...")
+def report_cached(token, analysis_type, chunked, all_sheets, format, _data):
+    return build_report(aggregate_cached(token, analysis_type, chunked, all_sheets, _data), format)
+
+
 st.title("📊 Manager Case Analysis Tool")
 st.write("Upload your Excel file and select the type of manager analysis you'd like to perform.")
 
 # Upload the Excel file
-uploaded_file = st.file_uploader("Upload Excel File", type=["xlsx"])
+uploaded_file = st.file_uploader("Upload Excel File", type=["xlsx", "csv", "parquet"],
+                                 help="CSV and Parquet exports are read much faster than .xlsx")
 
 # Let the user choose the type of analysis
 analysis_type = st.selectbox("Select Analysis Type", [
-    "Report Manager", "Assigning Manager", "Allotment Manager"
+    "Report Manager", "Assigning Manager", "Allotment Manager", ALL_ANALYSES
 ])
 
+# Low-memory mode streams rows into running counters instead of loading the sheet
+chunked = st.checkbox("Low-memory mode", value=os.environ.get("CHUNKED_ANALYSIS") == "1")
+
+# Every sheet with a Manager column, parsed in parallel, with per-sheet counts
+all_sheets = st.checkbox("All sheets", help="Analyze every sheet of the workbook, not just the first")
+
+# Columnar formats come as a zip with one file per report sheet
+report_format = st.selectbox("Report format", export_formats(),
+                             help="Parquet, Arrow and CSV skip Excel entirely; handy for loading into other tools")
+
 # Process once both file and selection are available
 if uploaded_file and analysis_type:
     try:
-        df = pd.read_excel(uploaded_file, skiprows=1)
-        df.columns = df.columns.str.strip()  # Clean column names
-
-        # Fill missing values
-        if analysis_type == "Report Manager":
-            df["Report Manager"].fillna(df["Manager"], inplace=True)
-            report_col = "Report Manager"
-            output_file = "manager_case_analysis_report.xlsx"
-        elif analysis_type == "Assigning Manager":
-            df["Assigning Manager"].fillna(df["Manager"], inplace=True)
-            report_col = "Assigning Manager"
-            output_file = "manager_case_analysis_assigning.xlsx"
-        else:
-            df["Allotment Manager"].fillna(df["Manager"], inplace=True)
-            report_col = "Allotment Manager"
-            output_file = "manager_case_analysis_allotment.xlsx"
-
-        # Manager counts
-        manager_cases = df["Manager"].value_counts().reset_index()
-        manager_cases.columns = ["Manager", "Number of Cases"]
-
-        # Report/Assigning/Allotment Manager counts
-        other_cases = df[report_col].value_counts().reset_index()
-        other_cases.columns = [report_col, "Number of Cases"]
-
-        # Display results
-        st.subheader("🔹 Manager Cases")
-        st.dataframe(manager_cases)
-
-        st.subheader(f"🔹 {report_col} Cases")
-        st.dataframe(other_cases)
-
-        # Export to Excel (in-memory for cloud deployment)
-        buffer = BytesIO()
-        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-            manager_cases.to_excel(writer, sheet_name="Manager Cases", index=False)
-            other_cases.to_excel(writer, sheet_name=f"{report_col} Cases", index=False)
+        # Stages served from Streamlit's cache don't run, so they don't show up in the timings
+        with collect_timings() as timings:
+            with timed("upload"):
+                data = uploaded_file.getvalue()
+                # Names are canonicalized while parsing, so editing the alias file must miss the caches
+                token = (upload_token(data), alias_version())
+
+            # Manager counts plus the selected report column (Manager fills its blanks)
+            result = aggregate_cached(token, analysis_type, chunked, all_sheets, data)
 
+            # Display results
+            with timed("render"):
+                for frame in result["frames"]:
+                    st.subheader(f"🔹 {frame.columns[0]} Cases")
+                    st.dataframe(frame)
+
+                for frame in result.get("breakdowns", []):
+                    st.subheader(f"🗃️ {frame.columns[0]} by Sheet")
+                    st.dataframe(frame, hide_index=True)
+
+                st.subheader("📈 Workload Distribution")
+                st.dataframe(summary_frame(result["frames"]).astype(str), hide_index=True)
+
+            report = report_cached(token, analysis_type, chunked, all_sheets, report_format, data)
+
+        # Export in the chosen format (in-memory for cloud deployment, fastest available writer)
         st.download_button(
             label="📥 Download Analysis Report",
-            data=buffer.getvalue(),
-            file_name=output_file,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            data=report,
+            file_name=export_file_name(result["output_file"], report_format),
+            mime=export_mimetype(report_format)
         )
 
+        with st.expander("⏱️ Stage timings"):
+            st.caption(f"{len(data):,} bytes uploaded")
+            st.table({"Stage": [stage for stage, _ in timings],
+                      "Milliseconds": [round(seconds * 1000, 1) for _, seconds in timings]})
+
     except Exception as e:
         st.error(f"Something went wrong: {e}")
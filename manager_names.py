@@ -0,0 +1,154 @@
+"""Canonical manager names, so spelling variants are counted together.
+
+Names are compared on a key: whitespace collapsed, "Last, First" turned into
+"First Last" and case folded. Names sharing a key are one manager, shown
+under the canonical name from the alias file when it lists them, otherwise
+under their most common spelling.
+
+The alias file (MANAGER_ALIASES, default manager_aliases.csv) is a CSV with
+an ``alias,canonical`` header and one known alias per row, e.g.
+``"Bob Smith",Robert Smith``. Its compiled index is cached until the file
+changes. Canonicalization can be turned off with CANONICAL_NAMES=0.
+"""
+import csv
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+ALIASES_PATH = os.environ.get("MANAGER_ALIASES", "manager_aliases.csv")
+ENABLED = os.environ.get("CANONICAL_NAMES", "1") != "0"
+
+
+@lru_cache(maxsize=65536)
+def clean_name(name):
+    """(display spelling, matching key) for one raw name."""
+    if not isinstance(name, str):
+        return name, name
+    cleaned = " ".join(name.split())
+    last, comma, first = cleaned.partition(",")
+    if comma and "," not in first and last.strip() and first.strip():
+        cleaned = f"{first.strip()} {last.strip()}"
+    return cleaned, cleaned.casefold()
+
+
+class AliasIndex:
+    """Compiled alias file: matching key -> canonical name."""
+
+    def __init__(self, aliases=()):
+        self.canonical = {}
+        for alias, canonical in aliases:
+            canonical = clean_name(canonical)[0]
+            self.canonical[clean_name(alias)[1]] = canonical
+            self.canonical.setdefault(clean_name(canonical)[1], canonical)
+
+    def __len__(self):
+        return len(self.canonical)
+
+    def resolve(self, names, counts):
+        """Canonical name for each of the unique ``names``, seen ``counts`` times each."""
+        keys = []
+        best = {}
+        for name, n in zip(names, counts):
+            cleaned, key = clean_name(name)
+            keys.append(key)
+            if key not in self.canonical and (key not in best or n > best[key][0]):
+                best[key] = (n, cleaned)
+        resolved = np.empty(len(keys), dtype=object)
+        resolved[:] = [self.canonical[k] if k in self.canonical else best[k][1] for k in keys]
+        return resolved
+
+
+# Without an alias file, only whitespace, "Last, First" and case are normalized
+NO_ALIASES = AliasIndex()
+
+
+def read_aliases(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = csv.DictReader(f)
+        if not rows.fieldnames or not {"alias", "canonical"} <= set(rows.fieldnames):
+            raise ValueError(f"{path} needs 'alias' and 'canonical' columns")
+        return [(row["alias"], row["canonical"]) for row in rows if row["alias"] and row["canonical"]]
+
+
+@lru_cache(maxsize=4)
+def _compile(path, mtime):
+    return AliasIndex(read_aliases(path))
+
+
+def alias_index(path=None):
+    """The compiled alias index, rebuilt only when the file's mtime changes."""
+    path = path or ALIASES_PATH
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return NO_ALIASES
+    return _compile(path, mtime)
+
+
+def alias_version(path=None):
+    """Changes whenever the alias file does; for keying caches of canonicalized data."""
+    try:
+        return os.stat(path or ALIASES_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def canonicalize(df, columns, index=None):
+    """``df`` with the name ``columns`` replaced by canonical names.
+
+    Each column is factorized, the distinct raw names of all columns are
+    resolved once, and a column is rebuilt by indexing the resolved uniques
+    with its codes; columns where every name is already canonical are left as
+    they are. The input frame is left untouched.
+    """
+    columns = [c for c in columns if c in df.columns]
+    if not ENABLED or not columns or not len(df):
+        return df
+    index = alias_index() if index is None else index
+
+    factorized = [df[c].factorize() for c in columns]
+    raw = [uniques.to_numpy(dtype=object) for _, uniques in factorized]
+    counts = np.concatenate([np.bincount(codes[codes >= 0], minlength=len(u)) for (codes, _), u in zip(factorized, raw)])
+    # The same name in several columns is resolved once, weighted by all its rows
+    name_codes, names = pd.factorize(np.concatenate(raw))
+    resolved = index.resolve(names, np.bincount(name_codes, weights=counts, minlength=len(names)))
+
+    out = df.copy(deep=False)
+    start = 0
+    for column, (codes, _), uniques in zip(columns, factorized, raw):
+        canonical = resolved.take(name_codes[start:start + len(uniques)])
+        start += len(uniques)
+        if (canonical == uniques).all():
+            continue
+        values = canonical.take(codes)
+        values[codes < 0] = None
+        out[column] = pd.Series(values, index=df.index, dtype=object)
+    return out
+
+
+def canonicalize_counts(frames, index=None):
+    """Merge count tables whose names are spelling variants of each other."""
+    if not ENABLED or not frames:
+        return frames
+    index = alias_index() if index is None else index
+
+    names = pd.concat([frame.iloc[:, 0] for frame in frames], ignore_index=True).to_numpy(dtype=object)
+    counts = pd.concat([frame.iloc[:, 1] for frame in frames], ignore_index=True).to_numpy()
+    codes, uniques = pd.factorize(names)
+    resolved = index.resolve(uniques, np.bincount(codes, weights=counts, minlength=len(uniques)))
+
+    merged = []
+    start = 0
+    for frame in frames:
+        name_col, count_col = frame.columns[:2]
+        part = codes[start:start + len(frame)]
+        start += len(frame)
+        table = (
+            pd.DataFrame({name_col: resolved.take(part), count_col: frame[count_col].to_numpy()})
+            .groupby(name_col, sort=False, as_index=False)[count_col].sum()
+            .sort_values(count_col, ascending=False, kind="stable", ignore_index=True)
+        )
+        merged.append(table)
+    return merged
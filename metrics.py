@@ -0,0 +1,250 @@
+"""Per-stage timings and counters for the analysis pipeline.
+
+Stages are timed with ``timed(stage)``; each observation lands in a
+process-wide latency histogram (served by the Flask app at /metrics in the
+Prometheus text format) and, when a collector is active, in the per-request
+list that becomes the Server-Timing header. Counters record how many rows,
+columns and bytes each stage handled.
+
+Each process records into its own registry. With METRICS_DIR set (the
+gunicorn config sets it), every worker writes a snapshot of its registry to
+that directory after each request. /metrics then merges the snapshots of all
+workers, dead ones included, so counters never go backwards whichever worker
+is scraped. Counters and histograms are summed; gauges take the largest
+value. Pool processes running jobs don't write snapshots.
+"""
+import bisect
+import contextvars
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = os.environ.get("METRICS_DIR")
+
+# Upper bounds in seconds, Prometheus style (+Inf is implied)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_timings = contextvars.ContextVar("timings", default=None)
+
+
+class Registry:
+    """Thread-safe histograms, counters and gauges keyed by (metric name, labels)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, help="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def inc(self, name, value=1, help="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, help="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("gauge", help))
+            self._gauges[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+            self._help.clear()
+
+    def snapshot(self):
+        """The registry's contents as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                "help": dict(self._help),
+                "histograms": [[name, labels, *entry] for (name, labels), entry in self._histograms.items()],
+                "counters": [[name, labels, value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, labels, value] for (name, labels), value in self._gauges.items()],
+            }
+
+    def merge(self, snapshot):
+        """Add another process's snapshot: counters and histograms sum, gauges keep the max."""
+        def key(name, labels):
+            return name, tuple(tuple(pair) for pair in labels)
+
+        with self._lock:
+            for name, (kind, help) in snapshot["help"].items():
+                self._help.setdefault(name, (kind, help))
+            for name, labels, buckets, total, count in snapshot["histograms"]:
+                entry = self._histograms.setdefault(key(name, labels), [[0] * len(self.buckets), 0.0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], buckets)]
+                entry[1] += total
+                entry[2] += count
+            for name, labels, value in snapshot["counters"]:
+                self._counters[key(name, labels)] = self._counters.get(key(name, labels), 0) + value
+            for name, labels, value in snapshot["gauges"]:
+                self._gauges[key(name, labels)] = max(value, self._gauges.get(key(name, labels), value))
+
+    def render(self):
+        """The registry in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items()) + sorted(self._gauges.items())
+            help = dict(self._help)
+
+        lines = []
+        seen = set()
+
+        def header(name):
+            if name not in seen:
+                seen.add(name)
+                kind, text = help[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), (buckets, total, count) in histograms:
+            header(name)
+            cumulative = 0
+            for bound, n in zip(self.buckets, buckets):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+REGISTRY = Registry()
+
+# Names this process's snapshot file; renewed in forked children so a worker
+# never overwrites the file of its parent or of an earlier worker with its PID
+_snapshot_name = None
+
+
+def _renew_snapshot_name():
+    global _snapshot_name
+    _snapshot_name = f"{os.getpid()}-{secrets.token_hex(4)}.json"
+
+
+_renew_snapshot_name()
+os.register_at_fork(after_in_child=_renew_snapshot_name)
+_flush_lock = threading.Lock()
+
+
+def flush(directory=None):
+    """Write this process's snapshot to METRICS_DIR (a no-op when it isn't set)."""
+    directory = directory or METRICS_DIR
+    if not directory:
+        return
+    data = json.dumps(REGISTRY.snapshot())
+    with _flush_lock:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(directory, _snapshot_name))
+
+
+def render(directory=None):
+    """Prometheus text for all processes sharing METRICS_DIR, or for this one without it."""
+    directory = directory or METRICS_DIR
+    if not directory:
+        return REGISTRY.render()
+    flush(directory)
+    merged = Registry(REGISTRY.buckets)
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".json"):
+            try:
+                with open(entry.path) as f:
+                    merged.merge(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return merged.render()
+
+
+def reset_shared(directory=None):
+    """Remove the snapshots in METRICS_DIR; the gunicorn master does this on start."""
+    directory = directory or METRICS_DIR
+    if directory and os.path.isdir(directory):
+        for entry in os.scandir(directory):
+            if entry.name.endswith((".json", ".tmp")):
+                os.remove(entry.path)
+
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block as pipeline ``stage``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        REGISTRY.observe("analysis_stage_seconds", elapsed, "Time spent in each pipeline stage.", stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def record(stage, rows=None, columns=None, bytes=None):
+    """Count the rows, columns and bytes a stage handled."""
+    for unit, value in (("rows", rows), ("columns", columns), ("bytes", bytes)):
+        if value is not None:
+            REGISTRY.inc(f"analysis_{unit}_total", int(value), f"{unit.capitalize()} handled by each pipeline stage.", stage=stage)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the (stage, seconds) pairs timed inside the block into the yielded list."""
+    timings = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def start_collecting():
+    """Like collect_timings, for callers that can't wrap a block; returns the list."""
+    timings = []
+    _timings.set(timings)
+    return timings
+
+
+def stop_collecting():
+    _timings.set(None)
+
+
+def server_timing(timings):
+    """Server-Timing header value for collected timings; repeated stages are summed."""
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
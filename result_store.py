@@ -0,0 +1,150 @@
+import os
+import pickle
+import secrets
+import sqlite3
+import time
+from contextlib import closing
+
+DEFAULT_PATH = os.environ.get("RESULT_STORE_PATH", "analysis_results.sqlite3")
+DEFAULT_TTL = int(os.environ.get("RESULT_TTL_SECONDS", 3600))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("RESULT_STORE_ENTRIES", 256))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    result_id TEXT PRIMARY KEY,
+    expires REAL NOT NULL,
+    output_file TEXT,
+    result BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_by_expiry ON results (expires);
+CREATE TABLE IF NOT EXISTS exports (
+    result_id TEXT NOT NULL REFERENCES results ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (result_id, key)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    expires REAL NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT
+) WITHOUT ROWID;
+"""
+
+
+class ResultStore:
+    """Store of analysis results keyed by an opaque, unguessable ID.
+
+    Results are pickled into a SQLite file, so every gunicorn worker on the
+    host sees the same results whichever one ran the analysis. Entries expire
+    ``ttl`` seconds after they were stored; the oldest entries are dropped
+    first once ``max_entries`` is reached. Rendered exports are memoized per
+    result so repeated downloads don't rebuild the file. The status of
+    background jobs is kept alongside (see jobs.JobQueue).
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._ready = False
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA foreign_keys=ON")
+        if not self._ready:
+            # Created on first use, so importing the app never touches the disk
+            with db:
+                db.executescript(SCHEMA)
+                # Stores created before the download name had its own column lack it
+                if "output_file" not in [row[1] for row in db.execute("PRAGMA table_info(results)")]:
+                    db.execute("ALTER TABLE results ADD COLUMN output_file TEXT")
+            self._ready = True
+        return db
+
+    def __len__(self):
+        with closing(self._connect()) as db:
+            return db.execute("SELECT count(*) FROM results WHERE expires > ?", (time.time(),)).fetchone()[0]
+
+    def put(self, result, result_id=None):
+        result_id = result_id or secrets.token_urlsafe(16)
+        blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM results WHERE expires <= ?", (now,))
+            db.execute("DELETE FROM jobs WHERE expires <= ?", (now,))
+            db.execute("DELETE FROM exports WHERE result_id = ?", (result_id,))
+            db.execute(
+                "INSERT OR REPLACE INTO results (result_id, expires, output_file, result) VALUES (?, ?, ?, ?)",
+                (result_id, now + self.ttl, result.get("output_file"), blob),
+            )
+            db.execute(
+                "DELETE FROM results WHERE result_id IN "
+                "(SELECT result_id FROM results ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        return result_id
+
+    def get(self, result_id):
+        with closing(self._connect()) as db:
+            row = db.execute(
+                "SELECT result FROM results WHERE result_id = ? AND expires > ?", (result_id, time.time())
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def get_export(self, result_id, key, build):
+        """Return (``build(result)``, output file name) for ``result_id``, building at most once per key.
+
+        A repeated download is a single indexed read of the stored bytes; the
+        result itself is only unpickled to build a new export. Returns None
+        when the result is unknown or has expired.
+        """
+        with closing(self._connect()) as db:
+            row = db.execute(
+                "SELECT exports.data, results.output_file FROM results "
+                "LEFT JOIN exports ON exports.result_id = results.result_id AND exports.key = ? "
+                "WHERE results.result_id = ? AND results.expires > ?",
+                (key, result_id, time.time()),
+            ).fetchone()
+            if row is None:
+                return None
+            data, output_file = row
+            # Rows stored before output_file had a column go through the result
+            if data is not None and output_file is not None:
+                return data, output_file
+            blob = db.execute("SELECT result FROM results WHERE result_id = ?", (result_id,)).fetchone()
+        if blob is None:
+            return None
+        result = pickle.loads(blob[0])
+        output_file = result["output_file"]
+        if data is not None:
+            return data, output_file
+        data = build(result)
+        with closing(self._connect()) as db, db:
+            # The result may have been evicted while the export was built
+            db.execute(
+                "INSERT OR REPLACE INTO exports SELECT result_id, ?, ? FROM results WHERE result_id = ?",
+                (key, data, result_id),
+            )
+        return data, output_file
+
+    def discard(self, result_id):
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM results WHERE result_id = ?", (result_id,))
+
+    def set_job(self, job_id, status, error=None):
+        """Record the status ("queued", "done" or "failed") of a background job."""
+        with closing(self._connect()) as db, db:
+            db.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?)", (job_id, time.time() + self.ttl, status, error))
+
+    def get_job(self, job_id):
+        """(status, error) of a background job, or None when it's unknown or expired."""
+        with closing(self._connect()) as db:
+            return db.execute(
+                "SELECT status, error FROM jobs WHERE job_id = ? AND expires > ?", (job_id, time.time())
+            ).fetchone()
+
+
+# Store shared by the Flask routes and every worker process on the host
+RESULT_STORE = ResultStore()
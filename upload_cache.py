@@ -0,0 +1,180 @@
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from analysis import canonical_names, parse_upload
+from manager_names import alias_index
+
+DEFAULT_MAX_BYTES = int(os.environ.get("UPLOAD_CACHE_MB", 256)) * 1024 * 1024
+DEFAULT_MAX_ENTRIES = int(os.environ.get("UPLOAD_CACHE_ENTRIES", 32))
+DEFAULT_DIR = os.environ.get("UPLOAD_CACHE_DIR", "upload_cache")
+DEFAULT_MAX_DISK_BYTES = int(os.environ.get("UPLOAD_CACHE_DISK_MB", 1024)) * 1024 * 1024
+
+# Tokens come back from the client, so only well-formed ones are turned into paths
+TOKEN = re.compile(r"[0-9a-f]{64}")
+
+
+def upload_token(data):
+    """Content hash used to key an upload; identical files share a token."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def frame_size(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class UploadCache:
+    """Thread-safe LRU of parsed uploads, bounded by entry count and memory.
+
+    Cached frames are shared between requests and must be treated as read-only.
+    Frames are kept with names as written and canonicalized on the way out
+    against the current alias file (memoized until it changes), so editing
+    manager_aliases.csv takes effect for cached uploads too. Every parsed frame is also pickled into ``directory`` (oldest files removed
+    past ``max_disk_bytes``), so a token handed out by one gunicorn worker can
+    be re-analyzed by another without the file being uploaded again.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES,
+                 directory=DEFAULT_DIR, max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        # token -> (alias index, canonicalized frame)
+        self._canonical = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, token):
+        return token in self._entries
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                self._entries.move_to_end(token)
+        if entry is not None:
+            return self._canonicalized(token, entry[0])
+        df = self._load(token)
+        if df is None:
+            return None
+        self._remember(token, df)
+        return self._canonicalized(token, df)
+
+    def put(self, token, df):
+        """Cache ``df``, a frame parsed with canonical=False."""
+        self._remember(token, df)
+        self._store(token, df)
+
+    def _remember(self, token, df):
+        size = frame_size(df)
+        with self._lock:
+            old = self._entries.pop(token, None)
+            self._canonical.pop(token, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[token] = (df, size)
+            self.total_bytes += size
+            while self._entries and (self.total_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                evicted, (_, evicted_size) = self._entries.popitem(last=False)
+                self._canonical.pop(evicted, None)
+                self.total_bytes -= evicted_size
+
+    def _canonicalized(self, token, df):
+        index = alias_index()
+        with self._lock:
+            memo = self._canonical.get(token)
+        if memo is not None and memo[0] is index:
+            return memo[1]
+        canonical = canonical_names(df, index)
+        with self._lock:
+            if token in self._entries:
+                self._canonical[token] = (index, canonical)
+        return canonical
+
+    def get_or_parse(self, data, parse=parse_upload):
+        """Return (token, canonicalized frame) for the uploaded bytes, parsing only on a miss."""
+        token = upload_token(data)
+        df = self.get(token)
+        if df is None:
+            df = parse(data, canonical=False)
+            self.put(token, df)
+            df = self._canonicalized(token, df)
+        return token, df
+
+    def _path(self, token):
+        return os.path.join(self.directory, f"{token}.pkl") if TOKEN.fullmatch(token) else None
+
+    def _load(self, token):
+        path = self._path(token)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                df = pickle.load(f)
+            os.utime(path)
+            return df
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _store(self, token, df):
+        path = self._path(token)
+        if path is None or os.path.exists(path):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Written under a temporary name so other workers never read a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._prune()
+
+    def _prune(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._canonical.clear()
+            self.total_bytes = 0
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".pkl"):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+
+# Cache shared by the Flask routes and the Streamlit script; its disk tier spans worker processes
+UPLOAD_CACHE = UploadCache()
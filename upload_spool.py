@@ -0,0 +1,145 @@
+"""Large uploads spooled to temp files and parsed from a memory map.
+
+Small uploads are read into bytes as before. Anything over
+``SPOOL_THRESHOLD`` is copied to a temp file in fixed-size blocks and
+memory-mapped read-only, so the parsers page it in from the OS cache instead
+of each request holding its own copy. The temp file is removed when the
+SpooledUpload is closed: at the end of the request, or when the background
+job that took it over finishes.
+
+Wherever upload bytes are accepted, a memory map works too; open_upload
+gives either one a file interface. Process-pool workers are handed the temp
+file's path instead (maps can't be pickled) and map it themselves.
+"""
+import io
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+MB = 1024 * 1024
+SPOOL_THRESHOLD = int(os.environ.get("UPLOAD_SPOOL_MB", 4)) * MB
+SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR") or None
+COPY_BLOCK = MB
+
+
+class MappedFile(io.RawIOBase):
+    """Read-only, seekable raw file over a memory map (or any buffer)."""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._size = len(buffer)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        end = min(self._position + len(b), self._size)
+        n = end - self._position
+        # Slicing copies just this block; no view onto the map is kept alive
+        b[:n] = self._buffer[self._position:end]
+        self._position = end
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._position = max(offset, 0)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def open_upload(data):
+    """A binary file object over upload bytes or a memory-mapped upload."""
+    if isinstance(data, (bytes, bytearray)):
+        return io.BytesIO(data)
+    return io.BufferedReader(MappedFile(data), buffer_size=COPY_BLOCK)
+
+
+class SpooledUpload:
+    """An upload copied to a temp file; ``data`` maps it read-only on first use."""
+
+    def __init__(self, stream, dir=SPOOL_DIR):
+        fd, self.path = tempfile.mkstemp(prefix="upload-", dir=dir)
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(stream, f, COPY_BLOCK)
+        self.size = os.path.getsize(self.path)
+        self._map = None
+
+    @property
+    def data(self):
+        if self._map is None:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stream_size(stream):
+    position = stream.tell()
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(position)
+    return size - position
+
+
+def spool_upload(stream, threshold=SPOOL_THRESHOLD):
+    """Bytes for an upload up to ``threshold``, a SpooledUpload for anything larger.
+
+    Empty uploads always come back as bytes (an empty file can't be mapped).
+    """
+    if stream_size(stream) <= threshold:
+        return stream.read()
+    return SpooledUpload(stream)
+
+
+def upload_data(upload):
+    """The bytes or memory map to parse for a spool_upload result."""
+    return upload.data if isinstance(upload, SpooledUpload) else upload
+
+
+def upload_payload(upload):
+    """What to send to a pool worker: the bytes, or the temp file's path."""
+    return upload.path if isinstance(upload, SpooledUpload) else upload
+
+
+@contextmanager
+def mapped(payload):
+    """Inside a pool worker, the bytes or a memory map for an upload_payload."""
+    if not isinstance(payload, str):
+        yield payload
+        return
+    with open(payload, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield data
+    finally:
+        data.close()
+
+
+def close_uploads(uploads):
+    for upload in uploads:
+        if isinstance(upload, SpooledUpload):
+            upload.close()
@@ -0,0 +1,277 @@
+import csv
+import io
+import os
+from itertools import islice
+from operator import itemgetter
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from columns import CASE_ID_COL, CREATED_COL, MANAGER_COL, REPORT_COLUMNS  # noqa: F401 (re-exported)
+
+# How far down the sheet we look for the header row. Exports normally carry a
+# one-line title above the header, which is what skiprows=1 used to assume.
+HEADER_SCAN_ROWS = 20
+
+# Rows per chunk for the streaming (low-memory) readers
+CHUNK_ROWS = int(os.environ.get("CHUNK_ROWS", 50_000))
+
+# Cells pandas would read as missing in a CSV
+CSV_NA_VALUES = {"", "#N/A", "N/A", "NA", "n/a", "NaN", "nan", "NULL", "null", "None", "<NA>"}
+
+
+def _clean(value):
+    return value.strip() if isinstance(value, str) else value
+
+
+def match_header(rows, columns, optional=()):
+    """Return (row_number, {column: index}) of the first of ``rows`` naming all ``columns``.
+
+    Any of the ``optional`` columns present on that row are included as well.
+    """
+    required = set(columns)
+    wanted = required | set(optional)
+    for row_number, row in enumerate(rows, start=1):
+        positions = {}
+        for index, value in enumerate(row):
+            name = _clean(value)
+            if name in wanted and name not in positions:
+                positions[name] = index
+        if required <= positions.keys():
+            return row_number, positions
+    raise ValueError(f"Could not find a header row with columns: {', '.join(columns)}")
+
+
+def find_header(ws, columns, optional=(), scan_rows=HEADER_SCAN_ROWS):
+    return match_header(ws.iter_rows(max_row=scan_rows, values_only=True), columns, optional)
+
+
+def iter_rows(ws, header_row, positions, columns):
+    """Yield tuples of the projected ``columns`` for every data row below the header."""
+    lo = min(positions.values())
+    hi = max(positions.values())
+    pick = itemgetter(*[positions[c] - lo for c in columns])
+    rows = ws.iter_rows(min_row=header_row + 1, min_col=lo + 1, max_col=hi + 1, values_only=True)
+    if len(columns) == 1:
+        for row in rows:
+            value = pick(row)
+            if value is not None:
+                yield (value,)
+        return
+    for row in rows:
+        values = pick(row)
+        if any(v is not None for v in values):
+            yield values
+
+
+def _read_xlsx(file, columns, optional, sheet=None):
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0] if sheet is None else wb[sheet]
+        header_row, positions = find_header(ws, columns, optional)
+        columns = list(columns) + [c for c in optional if c in positions and c not in columns]
+        data = list(zip(*iter_rows(ws, header_row, positions, columns)))
+    finally:
+        wb.close()
+
+    if not data:
+        data = [[] for _ in columns]
+    return pd.DataFrame({c: pd.Series(values, dtype=object) for c, values in zip(columns, data)})
+
+
+def _csv_header(file, columns, optional):
+    """Locate the CSV header row; returns (row_number, columns, indexes) and rewinds ``file``."""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        header_row, positions = match_header(islice(csv.reader(text), HEADER_SCAN_ROWS), columns, optional)
+    finally:
+        text.detach()
+    file.seek(0)
+    columns = list(columns) + [c for c in optional if c in positions and c not in columns]
+    return header_row, columns, [positions[c] for c in columns]
+
+
+def _empty_frame(columns):
+    return pd.DataFrame({c: pd.Series([], dtype=object) for c in columns})
+
+
+def _has_rows_after(file, header_row):
+    """Whether the CSV has any row below its header; rewinds ``file``."""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        return next(islice(csv.reader(text), header_row, None), None) is not None
+    finally:
+        text.detach()
+        file.seek(0)
+
+
+def _read_csv(file, columns, optional):
+    header_row, columns, indexes = _csv_header(file, columns, optional)
+    if not _has_rows_after(file, header_row):
+        # Both readers refuse a header with nothing under it
+        return _empty_frame(columns)
+    try:
+        from pyarrow import csv as pa_csv, string
+    except ImportError:
+        df = pd.read_csv(file, skiprows=header_row, header=None, usecols=indexes, dtype=str, encoding="utf-8-sig")
+        return df[indexes].set_axis(columns, axis=1)
+
+    # Columns are picked by position, so header spelling and padding don't matter
+    names = [f"f{i}" for i in indexes]
+    table = pa_csv.read_csv(
+        file,
+        read_options=pa_csv.ReadOptions(skip_rows=header_row, autogenerate_column_names=True),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=names,
+            column_types={name: string() for name in names},
+            strings_can_be_null=True,
+        ),
+    )
+    return table.to_pandas().set_axis(columns, axis=1)
+
+
+def _parquet_columns(schema_names, columns, optional):
+    # Parquet has no preamble; the schema names are the header
+    _, positions = match_header([schema_names], columns, optional)
+    columns = list(columns) + [c for c in optional if c in positions and c not in columns]
+    return columns, [schema_names[positions[c]] for c in columns]
+
+
+def _read_parquet(file, columns, optional):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(file)
+    columns, raw = _parquet_columns(parquet.schema_arrow.names, columns, optional)
+    return parquet.read(columns=raw).to_pandas().set_axis(columns, axis=1)
+
+
+def detect_format(file):
+    """"xlsx", "parquet" or "csv", judged from the first bytes of ``file``."""
+    position = file.tell()
+    signature = file.read(4)
+    file.seek(position)
+    if signature == b"PK\x03\x04":
+        return "xlsx"
+    if signature == b"PAR1":
+        return "parquet"
+    return "csv"
+
+
+def read_columns(file, columns, optional=(), sheet=None):
+    """Read only ``columns`` from an .xlsx, .csv or .parquet upload.
+
+    Workbooks are opened in openpyxl read-only mode so rows are streamed from
+    the XML instead of building the full cell model; ``sheet`` picks the
+    worksheet by name (default: the first). CSV and Parquet go through
+    pyarrow's columnar readers. Either way only the requested columns are ever
+    materialized; ``optional`` columns are read too when the file has them.
+    """
+    format = detect_format(file)
+    if format == "xlsx":
+        return _read_xlsx(file, columns, optional, sheet)
+    if sheet is not None:
+        raise ValueError("Only .xlsx workbooks have sheets to choose from.")
+    reader = {"parquet": _read_parquet, "csv": _read_csv}[format]
+    return reader(file, columns, optional)
+
+
+def find_sheets(file, columns):
+    """Names of the worksheets that have a header row with all ``columns``."""
+    if detect_format(file) != "xlsx":
+        raise ValueError("Multi-sheet analysis needs an .xlsx workbook.")
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheets = []
+        for ws in wb.worksheets:
+            try:
+                find_header(ws, columns)
+            except ValueError:
+                continue
+            sheets.append(ws.title)
+    finally:
+        wb.close()
+    file.seek(0)
+    if not sheets:
+        raise ValueError(f"No sheet has a header row with columns: {', '.join(columns)}")
+    return sheets
+
+
+def require_column(df, column):
+    if column not in df.columns:
+        raise ValueError(f"Column '{column}' was not found in the uploaded file.")
+
+
+def _chunked(rows, chunk_size):
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _xlsx_chunks(file, columns, optional, chunk_size):
+    wb = load_workbook(file, read_only=True, data_only=True)
+    ws = wb.worksheets[0]
+    try:
+        header_row, positions = find_header(ws, columns, optional)
+    except Exception:
+        wb.close()
+        raise
+    columns = list(columns) + [c for c in optional if c in positions and c not in columns]
+
+    def chunks():
+        try:
+            yield from _chunked(iter_rows(ws, header_row, positions, columns), chunk_size)
+        finally:
+            wb.close()
+
+    return columns, chunks()
+
+
+def _csv_chunks(file, columns, optional, chunk_size):
+    header_row, columns, indexes = _csv_header(file, columns, optional)
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    reader = csv.reader(text)
+    for _ in islice(reader, header_row):
+        pass
+    width = max(indexes) + 1
+
+    def rows():
+        for row in reader:
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            values = tuple(None if row[i] in CSV_NA_VALUES else row[i] for i in indexes)
+            if any(v is not None for v in values):
+                yield values
+
+    def chunks():
+        try:
+            yield from _chunked(rows(), chunk_size)
+        finally:
+            text.detach()
+
+    return columns, chunks()
+
+
+def _parquet_chunks(file, columns, optional, chunk_size):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(file)
+    columns, raw = _parquet_columns(parquet.schema_arrow.names, columns, optional)
+
+    def chunks():
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=raw):
+            yield list(zip(*(column.to_pylist() for column in batch.columns)))
+
+    return columns, chunks()
+
+
+def open_chunks(file, columns, optional=(), chunk_size=CHUNK_ROWS):
+    """Stream an .xlsx, .csv or .parquet upload as lists of row tuples, ``chunk_size`` rows at a time.
+
+    Returns (columns, chunks); ``columns`` names the tuple fields, i.e. ``columns``
+    plus whichever ``optional`` columns were found. Only one chunk is held in
+    memory at a time.
+    """
+    reader = {"xlsx": _xlsx_chunks, "parquet": _parquet_chunks, "csv": _csv_chunks}[detect_format(file)]
+    return reader(file, columns, optional, chunk_size)